@@ -1,5 +1,276 @@
+import re
+import types
 import yaml
 import os
+from typing import Any, Mapping, NamedTuple, Optional, Tuple
 
-with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "config.yaml"), "r") as f:
-    settings = yaml.safe_load(f)
+from const import (
+    DEFAULT_COMMAND_TIMEOUT,
+    DEFAULT_COMMAND_RETRIES,
+    DEFAULT_UPDATE_RETRIES,
+    DEFAULT_CONFIG_TIMEOUT,
+    DEFAULT_STATE_SNAPSHOT_INTERVAL,
+    STATE_FORMAT_ATTRIBUTES,
+    STATE_FORMAT_JSON,
+)
+from exceptions import ConfigError
+
+WORKERS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "workers")
+
+_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+_MAC = re.compile(r"^[0-9A-Fa-f]{2}([:-])(?:[0-9A-Fa-f]{2}\1){4}[0-9A-Fa-f]{2}$")
+_ADAPTER = re.compile(r"^(?:hci)?(\d+)$")
+_INTERVAL = re.compile(r"(\d+(?:\.\d+)?)\s*([smhd]?)")
+_INTERVAL_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+# Worker args holding durations
+_INTERVAL_ARGS = (
+    "scan_timeout",
+    "per_device_timeout",
+    "command_timeout",
+    "session_idle_timeout",
+    "default_update_interval",
+    "rapid_update_interval",
+)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config.yaml")
+
+
+def load_settings():
+    with open(CONFIG_PATH, "r") as f:
+        return yaml.safe_load(f)
+
+
+def __getattr__(name):
+    # Read on first use, so the validation helpers can be imported without a config.yaml
+    if name == "settings":
+        value = globals()["settings"] = load_settings()
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+class WorkerConfig(NamedTuple):
+    name: str
+    # Worker module, the name unless given
+    type: str
+    args: Mapping[str, Any]
+    update_interval: Optional[float]
+    command_timeout: float
+    command_retries: int
+    update_retries: int
+    config_timeout: float
+    topic_subscription: Optional[str]
+    publish_on_change: Optional[bool]
+    publish_heartbeat: Optional[float]
+
+
+class ManagerConfig(NamedTuple):
+    command_timeout: float
+    command_retries: int
+    update_retries: int
+    sensor_config: Optional[Mapping[str, Any]]
+    topic_subscription: Mapping[str, Mapping[str, str]]
+    workers: Tuple[WorkerConfig, ...]
+    state_snapshot: Optional[str]
+    state_snapshot_interval: float
+
+
+def parse_interval(value, what):
+    """
+    Parse a duration given in seconds, or as a string with units like "90", "30s", "5m" or "1h30m"
+    :return: seconds
+    """
+    if isinstance(value, bool):
+        raise ConfigError("Invalid {}: {!r}".format(what, value))
+    if isinstance(value, (int, float)):
+        seconds = value
+    elif isinstance(value, str) and re.fullmatch(r"(?:\s*\d+(?:\.\d+)?\s*[smhd]?)+\s*", value):
+        seconds = sum(
+            float(amount) * _INTERVAL_UNITS[unit] for amount, unit in _INTERVAL.findall(value)
+        )
+    else:
+        raise ConfigError("Invalid {}: {!r}".format(what, value))
+
+    if seconds < 0:
+        raise ConfigError("Invalid {}: {!r} is negative".format(what, value))
+    return int(seconds) if float(seconds).is_integer() else seconds
+
+
+def normalize_mac(value, what):
+    # The case is kept, discovery ids of existing entities are derived from it
+    if not isinstance(value, str) or not _MAC.match(value.strip()):
+        raise ConfigError("Invalid MAC address of {}: {!r}".format(what, value))
+    return value.strip().replace("-", ":")
+
+
+def normalize_adapter(value, what):
+    """
+    :return: adapter index, given as a number or as hciN
+    """
+    match = _ADAPTER.match(str(value).strip())
+    if isinstance(value, bool) or not match:
+        raise ConfigError("Invalid bluetooth adapter of {}: {!r}".format(what, value))
+    return int(match.group(1))
+
+
+def _parse_count(value, what):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ConfigError("Invalid {}: {!r}".format(what, value))
+    return value
+
+
+def _normalize_device(device, what):
+    if isinstance(device, str):
+        return normalize_mac(device, what)
+    if isinstance(device, dict):
+        device = dict(device)
+        if "mac" in device:
+            device["mac"] = normalize_mac(device["mac"], what)
+        for key in ("iface", "interface"):
+            if device.get(key) is not None:
+                device[key] = normalize_adapter(device[key], what)
+        return device
+    return device
+
+
+def _normalize_args(name, args):
+    if args is None:
+        args = {}
+    if not isinstance(args, dict):
+        raise ConfigError("args of worker '{}' must be a mapping".format(name))
+
+    args = dict(args)
+    if "mac" in args:
+        args["mac"] = normalize_mac(args["mac"], "worker '{}'".format(name))
+    if isinstance(args.get("devices"), dict):
+        args["devices"] = {
+            device_name: _normalize_device(device, "device '{}' of worker '{}'".format(device_name, name))
+            for device_name, device in args["devices"].items()
+        }
+    if args.get("adapter") is not None:
+        args["adapter"] = "hci{}".format(normalize_adapter(args["adapter"], "worker '{}'".format(name)))
+    if args.get("iface") is not None:
+        args["iface"] = normalize_adapter(args["iface"], "worker '{}'".format(name))
+    if "state_format" in args and args["state_format"] not in (STATE_FORMAT_ATTRIBUTES, STATE_FORMAT_JSON):
+        raise ConfigError("Unsupported state_format {!r} of worker '{}'".format(args["state_format"], name))
+    for key in _INTERVAL_ARGS:
+        if key in args:
+            args[key] = parse_interval(args[key], "{} of worker '{}'".format(key, name))
+    return types.MappingProxyType(args)
+
+
+def _worker_config(name, config, manager):
+    if not isinstance(name, str) or not _NAME.match(name):
+        raise ConfigError("Invalid worker name {!r}, only letters, digits, _ and - are allowed".format(name))
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise ConfigError("Config of worker '{}' must be a mapping".format(name))
+    worker_type = config.get("type", name)
+    if not isinstance(worker_type, str) or not os.path.isfile(os.path.join(WORKERS_DIR, "{}.py".format(worker_type))):
+        if worker_type == name:
+            raise ConfigError("Unknown worker '{}', give the type of named workers".format(name))
+        raise ConfigError("Unknown type {!r} of worker '{}'".format(worker_type, name))
+
+    what = "of worker '{}'".format(name)
+    update_interval = config.get("update_interval")
+    if update_interval is not None:
+        update_interval = parse_interval(update_interval, "update_interval " + what)
+        if not update_interval:
+            raise ConfigError("update_interval {} must be greater than 0".format(what))
+
+    topic_subscription = config.get("topic_subscription")
+    if topic_subscription is not None and not isinstance(topic_subscription, str):
+        raise ConfigError("topic_subscription {} must be a topic".format(what))
+
+    publish_heartbeat = config.get("publish_heartbeat")
+    if publish_heartbeat is not None:
+        publish_heartbeat = parse_interval(publish_heartbeat, "publish_heartbeat " + what)
+
+    return WorkerConfig(
+        name=name,
+        type=worker_type,
+        args=_normalize_args(name, config.get("args")),
+        update_interval=update_interval,
+        command_timeout=parse_interval(
+            config.get("command_timeout", manager["command_timeout"]), "command_timeout " + what
+        ),
+        command_retries=_parse_count(
+            config.get("command_retries", manager["command_retries"]), "command_retries " + what
+        ),
+        update_retries=_parse_count(
+            config.get("update_retries", manager["update_retries"]), "update_retries " + what
+        ),
+        config_timeout=parse_interval(
+            config.get("config_timeout", manager["config_timeout"]), "config_timeout " + what
+        ),
+        topic_subscription=topic_subscription,
+        publish_on_change=None if config.get("publish_on_change") is None else bool(config["publish_on_change"]),
+        publish_heartbeat=publish_heartbeat,
+    )
+
+
+def manager_config(config):
+    """
+    Validate and normalize the manager settings once, misconfiguration fails here rather than when polling
+    :param config: manager section of the settings
+    :return: ManagerConfig
+    """
+    if not isinstance(config, dict):
+        raise ConfigError("manager settings must be a mapping")
+
+    sensor_config = config.get("sensor_config")
+    if sensor_config is not None and not isinstance(sensor_config, dict):
+        raise ConfigError("sensor_config must be a mapping")
+
+    defaults = {
+        "command_timeout": parse_interval(config.get("command_timeout", DEFAULT_COMMAND_TIMEOUT), "command_timeout"),
+        "command_retries": _parse_count(config.get("command_retries", DEFAULT_COMMAND_RETRIES), "command_retries"),
+        "update_retries": _parse_count(config.get("update_retries", DEFAULT_UPDATE_RETRIES), "update_retries"),
+        "config_timeout": parse_interval(
+            (sensor_config or {}).get("timeout", DEFAULT_CONFIG_TIMEOUT), "sensor_config timeout"
+        ),
+    }
+
+    topic_subscription = config.get("topic_subscription") or {}
+    for callback_name, options in topic_subscription.items():
+        if not isinstance(options, dict) or "topic" not in options or "payload" not in options:
+            raise ConfigError("topic_subscription '{}' needs a topic and a payload".format(callback_name))
+
+    workers = config.get("workers")
+    if not workers:
+        raise ConfigError("No workers configured")
+
+    state_snapshot = config.get("state_snapshot")
+    if state_snapshot is not None and not isinstance(state_snapshot, str):
+        raise ConfigError("state_snapshot must be a path")
+    state_snapshot_interval = parse_interval(
+        config.get("state_snapshot_interval", DEFAULT_STATE_SNAPSHOT_INTERVAL), "state_snapshot_interval"
+    )
+    if not state_snapshot_interval:
+        raise ConfigError("state_snapshot_interval must be greater than 0")
+
+    worker_configs = tuple(
+        _worker_config(name, worker_config, defaults) for name, worker_config in workers.items()
+    )
+    # Instances of a type would otherwise share their topics, e.g. the update_interval one
+    topic_prefixes = {}
+    for worker_config in worker_configs:
+        key = (worker_config.type, worker_config.args.get("topic_prefix"))
+        if key in topic_prefixes:
+            raise ConfigError(
+                "Workers '{}' and '{}' of type {} need different topic_prefix args".format(
+                    topic_prefixes[key], worker_config.name, worker_config.type
+                )
+            )
+        topic_prefixes[key] = worker_config.name
+
+    return ManagerConfig(
+        command_timeout=defaults["command_timeout"],
+        command_retries=defaults["command_retries"],
+        update_retries=defaults["update_retries"],
+        sensor_config=types.MappingProxyType(dict(sensor_config)) if sensor_config is not None else None,
+        topic_subscription=types.MappingProxyType(dict(topic_subscription)),
+        workers=worker_configs,
+        state_snapshot=state_snapshot,
+        state_snapshot_interval=state_snapshot_interval,
+    )
@@ -2,3 +2,7 @@ DEFAULT_COMMAND_TIMEOUT = 35  # In seconds
 DEFAULT_PER_DEVICE_TIMEOUT = 8  # In seconds
 DEFAULT_COMMAND_RETRIES = 0
 DEFAULT_UPDATE_RETRIES = 0
+DEFAULT_CONFIG_TIMEOUT = 10  # In seconds
+DEFAULT_STATE_SNAPSHOT_INTERVAL = 60  # In seconds
+STATE_FORMAT_ATTRIBUTES = "attributes"
+STATE_FORMAT_JSON = "json"
@@ -0,0 +1,89 @@
+"""
+JSON encoding of MQTT payloads and discovery documents.
+
+orjson is used when it is installed, stdlib json otherwise. Both produce the same compact,
+utf-8 encoded output: NaN and infinities become null as JSON has no spelling for them, and float
+exponents are spelled the way orjson does (1e16, 0.00001), see _floatstr.
+"""
+import json
+import json.encoder
+import math
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, allow_nan=False)
+# Exponents as spelled by float.__repr__, outside of strings only found in floats
+_EXPONENT = re.compile(r"\de[-+]\d")
+
+
+def _floatstr(value):
+    text = float.__repr__(value)
+    mantissa, _, exponent = text.partition("e")
+    if not exponent:
+        return text
+    if int(exponent) == -5:
+        # Written out by orjson down to 1e-5, by repr down to 1e-4
+        sign, digits = ("-", mantissa[1:]) if mantissa.startswith("-") else ("", mantissa)
+        return "{}0.0000{}".format(sign, digits.replace(".", ""))
+    return "{}e{}".format(mantissa, int(exponent))
+
+
+def _finite(obj):
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    return obj
+
+
+def _stdlib_dumpb(obj) -> bytes:
+    try:
+        text = _json_encoder.encode(obj)
+    except ValueError:
+        # Non finite floats, encoded as null like orjson does
+        obj = _finite(obj)
+        text = _json_encoder.encode(obj)
+    if _EXPONENT.search(text):
+        # The C encoder always spells floats with repr, only the pure Python one takes a float formatter
+        text = "".join(
+            json.encoder._make_iterencode(
+                {}, _json_encoder.default, json.encoder.py_encode_basestring, None, _floatstr,
+                ":", ",", False, False, True,
+            )(obj, 0)
+        )
+    return text.encode("utf-8")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumpb(obj) -> bytes:
+        """
+        Encode obj as JSON bytes
+        :param obj: any JSON serializable value
+        :return: utf-8 encoded JSON
+        """
+        try:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, let stdlib json encode or reject them
+            return _stdlib_dumpb(obj)
+
+
+else:
+    dumpb = _stdlib_dumpb
+
+
+def dumps(obj) -> str:
+    """
+    Encode obj as a JSON string
+    :param obj: any JSON serializable value
+    :return: JSON document
+    """
+    return dumpb(obj).decode("utf-8")
@@ -4,3 +4,7 @@ class WorkerTimeoutError(Exception):
 
 class DeviceTimeoutError(Exception):
     pass
+
+
+class ConfigError(Exception):
+    pass
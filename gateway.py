@@ -2,7 +2,13 @@
 
 import sys
 
-from exceptions import WorkerTimeoutError, DeviceTimeoutError
+import profiler
+
+if "--profile-startup" in sys.argv:
+    # Imports are timed from the very start, before the arguments are parsed
+    profiler.install()
+
+from exceptions import ConfigError, WorkerTimeoutError, DeviceTimeoutError
 
 if sys.version_info < (3, 5):
     print("To use this script you need python 3.5 or newer! got %s" % sys.version_info)
@@ -10,16 +16,19 @@ if sys.version_info < (3, 5):
 
 import logger
 
-logger.setup()
+with profiler.phase("logger"):
+    logger.setup()
 
-import logging
-import argparse
-import queue
+with profiler.phase("imports"):
+    import logging
+    import argparse
+    import queue
+    import signal
 
-import workers_requirements
-from workers_queue import _WORKERS_QUEUE
-from mqtt import MqttClient
-from workers_manager import WorkersManager
+    import workers_requirements
+    from workers_queue import _WORKERS_QUEUE
+    from mqtt import create_client
+    from workers_manager import WorkersManager
 
 
 parser = argparse.ArgumentParser()
@@ -46,6 +55,38 @@ parser.add_argument(
     default=False,
     help="Suppress any errors regarding failed device updates",
 )
+parser.add_argument(
+    "--no-verify",
+    dest="verify",
+    action="store_false",
+    default=True,
+    help="Skip verifying the requirements of configured workers, e.g. for supervised restarts",
+)
+parser.add_argument(
+    "--log-queue",
+    dest="log_queue",
+    type=int,
+    default=logger.DEFAULT_QUEUE_SIZE,
+    metavar="SIZE",
+    help="Write logs from a background thread, buffering up to SIZE records. 0 writes synchronously",
+)
+parser.add_argument(
+    "--profile-startup",
+    dest="profile_startup",
+    type=int,
+    nargs="?",
+    const=profiler.DEFAULT_DEVICES,
+    metavar="DEVICES",
+    help="Time the startup of the configured workers with DEVICES fake devices each (default %d), "
+         "without connecting to MQTT, and print the phases and import times as JSON" % profiler.DEFAULT_DEVICES,
+)
+parser.add_argument(
+    "--profile-output",
+    dest="profile_output",
+    default="-",
+    metavar="PATH",
+    help="Write the --profile-startup report to PATH instead of stdout",
+)
 parser.add_argument("-r", "--requirements", type=str, choices=['all', 'configured'],
                     help="Print all or configured only required python libs")
 parsed = parser.parse_args()
@@ -60,7 +101,7 @@ if parsed.requirements:
     print(' '.join(requirements))
     exit(0)
 
-from config import settings
+from config import settings, manager_config
 
 _LOGGER = logger.get()
 if parsed.quiet:
@@ -71,21 +112,57 @@ elif parsed.debug:
 else:
     _LOGGER.setLevel(logging.INFO)
 logger.suppress_update_failures(parsed.suppress)
+if parsed.log_queue > 0:
+    logger.enable_queue(parsed.log_queue)
+
+if parsed.profile_startup is not None:
+    if parsed.profile_output == "-" and not parsed.debug:
+        # Keep the report on stdout parseable
+        _LOGGER.setLevel(logging.ERROR)
+    try:
+        report = profiler.run(parsed.profile_startup)
+    except ConfigError as e:
+        _LOGGER.error("Invalid configuration: %s", e)
+        exit(1)
+    logger.disable_queue()
+    profiler.write(report, parsed.profile_output)
+    exit(0)
 
 _LOGGER.info("Starting")
 
-workers_requirements.verify()
+try:
+    config = manager_config(settings["manager"])
+except ConfigError as e:
+    _LOGGER.error("Invalid configuration: %s", e)
+    exit(1)
+
+if parsed.verify:
+    workers_requirements.verify()
 
 global_topic_prefix = settings["mqtt"].get("topic_prefix")
 
-mqtt = MqttClient(settings["mqtt"])
-manager = WorkersManager(settings["manager"], mqtt)
-manager.register_workers(global_topic_prefix)
+mqtt = create_client(settings["mqtt"])
+manager = WorkersManager(config, mqtt)
+try:
+    manager.register_workers(global_topic_prefix)
+except ConfigError as e:
+    _LOGGER.error("Invalid configuration: %s", e)
+    exit(1)
 manager.start()
 
 running = True
 
+
+def request_reload(signum, frame):
+    # Applied from the main loop, the handler may interrupt it while it holds the queue lock
+    manager.request_reload()
+
+
+if hasattr(signal, "SIGHUP"):
+    signal.signal(signal.SIGHUP, request_reload)
+
 while running:
+    manager.reload_if_requested()
     try:
         mqtt.publish(_WORKERS_QUEUE.get(timeout=10).execute())
     except queue.Empty:  # Allow for SIGINT processing
@@ -93,14 +170,17 @@ while running:
     except (WorkerTimeoutError, DeviceTimeoutError) as e:
         logger.log_exception(
             _LOGGER,
-            str(e) if str(e) else "Timeout while executing worker command",
+            "%s",
+            str(e) or "Timeout while executing worker command",
             suppress=True,
+            key=(type(e).__name__, str(e)),
         )
     except (KeyboardInterrupt, SystemExit):
         running = False
         _LOGGER.info(
             "Finish current jobs and shut down. If you need force exit use kill"
         )
+        manager.stop()
     except Exception as e:
         logger.log_exception(
             _LOGGER, "Fatal error while executing worker command: %s", type(e).__name__
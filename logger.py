@@ -1,9 +1,69 @@
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import queue
+import threading
+import time
 import yaml
 
 APP_ROOT = "bt-mqtt-gw"
 SUPPRESSION_ENABLED = False
+# Records buffered for the background writer, records beyond are dropped
+DEFAULT_QUEUE_SIZE = 10000
+
+# Repeated failures of the same key are summarized once per interval, with a traceback at most once per
+# traceback interval
+FAILURE_SUMMARY_INTERVAL = 300  # In seconds
+FAILURE_TRACEBACK_INTERVAL = 3600  # In seconds
+FAILURE_MAX_KEYS = 1024
+
+_LISTENER = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a bounded queue without blocking, dropping them when it's full.
+    Only the message is merged in the calling thread, formatting is left to the writer.
+    """
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+        self._reported = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # Arguments may change after the call, so the message can't wait for the writer
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        with self._lock:
+            unreported = self.dropped - self._reported
+            if unreported:
+                try:
+                    self.queue.put_nowait(self._dropped_record(unreported))
+                    self._reported = self.dropped
+                except queue.Full:
+                    pass
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    @staticmethod
+    def _dropped_record(count):
+        return get(__name__).makeRecord(
+            get(__name__).name,
+            logging.WARNING,
+            __file__,
+            0,
+            "Logging can't keep up, dropped {} log records".format(count),
+            None,
+            None,
+        )
 
 
 def setup():
@@ -20,14 +80,66 @@ def get(name=None):
     return logging.getLogger(logger_name)
 
 
+def enable_queue(max_size=DEFAULT_QUEUE_SIZE):
+    """
+    Move the root handlers to a background writer thread, so slow outputs don't stall the workers
+    """
+    global _LISTENER
+    if _LISTENER is not None:
+        return
+
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(queue.Queue(max_size)))
+
+    _LISTENER = logging.handlers.QueueListener(root.handlers[0].queue, *handlers, respect_handler_level=True)
+    _LISTENER.start()
+    atexit.register(disable_queue)
+
+
+def disable_queue():
+    """
+    Flush the queued records and write synchronously again
+    """
+    global _LISTENER
+    if _LISTENER is None:
+        return
+
+    listener, _LISTENER = _LISTENER, None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, DroppingQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+
+
+def dropped_records():
+    handlers = logging.getLogger().handlers
+    return sum(handler.dropped for handler in handlers if isinstance(handler, DroppingQueueHandler))
+
+
+def _output_handlers():
+    if _LISTENER is not None:
+        return _LISTENER.handlers
+    return logging.getLogger().handlers
+
+
 def enable_debug_formatter():
-    logging.getLogger().handlers[0].setFormatter(
+    _output_handlers()[0].setFormatter(
         logging.getLogger("dummy_debug").handlers[0].formatter
     )
 
 
 def reset():
     app_level = get().getEffectiveLevel()
+    queue_size = None
+    if _LISTENER is not None:
+        queue_size = logging.getLogger().handlers[0].queue.maxsize
+        disable_queue()
 
     root = logging.getLogger()
     map(root.removeHandler, root.handlers[:])
@@ -37,6 +149,8 @@ def reset():
     get().setLevel(app_level)
     if app_level <= logging.DEBUG:
         enable_debug_formatter()
+    if queue_size is not None:
+        enable_queue(queue_size)
 
 
 def suppress_update_failures(suppress):
@@ -44,9 +158,82 @@ def suppress_update_failures(suppress):
     SUPPRESSION_ENABLED = suppress
 
 
+class FailureAggregator:
+    """
+    Tracks repeated failures by key, e.g. (worker, device, exception type). The first failure is logged,
+    the following ones only once per summary interval along with how many were left out.
+    """
+
+    def __init__(self, interval=FAILURE_SUMMARY_INTERVAL, traceback_interval=FAILURE_TRACEBACK_INTERVAL,
+                 max_keys=FAILURE_MAX_KEYS):
+        self.interval = interval
+        self.traceback_interval = traceback_interval
+        self.max_keys = max_keys
+        # key -> [last logged, last traceback, failures left out]
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def record(self, key):
+        """
+        :return: (log it, failures left out, seconds since it was last logged, include a traceback)
+        """
+        now = time.monotonic()
+        with self._lock:
+            failure = self._failures.get(key)
+            if failure is None:
+                if len(self._failures) >= self.max_keys:
+                    self._prune(now)
+                self._failures[key] = [now, now, 0]
+                return True, 0, 0, True
+
+            elapsed = now - failure[0]
+            if elapsed < self.interval:
+                failure[2] += 1
+                return False, failure[2], elapsed, False
+
+            skipped = failure[2]
+            with_traceback = now - failure[1] >= self.traceback_interval
+            failure[0] = now
+            failure[2] = 0
+            if with_traceback:
+                failure[1] = now
+            return True, skipped, elapsed, with_traceback
+
+    def _prune(self, now):
+        for key, failure in list(self._failures.items()):
+            if now - failure[0] >= self.interval:
+                del self._failures[key]
+        if len(self._failures) >= self.max_keys:
+            # All of them are recent, forget the oldest
+            del self._failures[min(self._failures, key=lambda k: self._failures[k][0])]
+
+
+_FAILURES = FailureAggregator()
+
+
 def log_exception(logger, message, *args, **kwargs):
-    if not (kwargs.pop('suppress', False) and SUPPRESSION_ENABLED):
-        if logger.isEnabledFor(logging.DEBUG):
-            logger.exception(message, *args, **kwargs)
-        elif logger.isEnabledFor(logging.WARNING):
-            logger.warning(message, *args, **kwargs)
+    """
+    Log a failure, with its traceback at debug level. Failures passing a key are aggregated:
+    repeats of the same key are summarized periodically and their tracebacks sampled.
+    """
+    key = kwargs.pop('key', None)
+    if kwargs.pop('suppress', False) and SUPPRESSION_ENABLED:
+        return
+    if not logger.isEnabledFor(logging.WARNING):
+        return
+
+    with_traceback = True
+    if key is not None:
+        log, skipped, elapsed, with_traceback = _FAILURES.record(key)
+        if not log:
+            return
+        if skipped:
+            # The message of the caller is merged first, it may contain anything once formatted
+            message, args = "%s (%d more in the last %.0f minutes)", (
+                message % args if args else message, skipped, elapsed / 60
+            )
+
+    if with_traceback and logger.isEnabledFor(logging.DEBUG):
+        logger.exception(message, *args, **kwargs)
+    else:
+        logger.warning(message, *args, **kwargs)
@@ -1,21 +1,236 @@
+import hashlib
 import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
 
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+import encoder
 import logger
+from spool import MessageSpool, DEFAULT_MAX_BYTES, REPLAY_ALL
+from topics import TopicRegistry
 
 LWT_ONLINE = "online"
 LWT_OFFLINE = "offline"
+DEFAULT_PUBLISH_HEARTBEAT = 300  # In seconds
+DEFAULT_PUBLISH_CACHE_SIZE = 10000
+DEFAULT_INFLIGHT_WINDOW = 100
+DEFAULT_PUBLISH_TIMEOUT = 10  # In seconds
+DEFAULT_SPOOL_DRAIN_RATE = 50  # Messages per second
+DEFAULT_SESSION_EXPIRY = 3600  # In seconds
+DEFAULT_MESSAGE_EXPIRY = 600  # In seconds
+DEFAULT_BROKER_QUEUE_SIZE = 1000  # In publish batches
+MESSAGE_CLASS_STATE = "state"
+MESSAGE_CLASS_DISCOVERY = "discovery"
+MESSAGE_CLASS_AVAILABILITY = "availability"
+DEFAULT_QOS = {
+    MESSAGE_CLASS_STATE: 0,
+    MESSAGE_CLASS_DISCOVERY: 0,
+    MESSAGE_CLASS_AVAILABILITY: 0,
+}
 _LOGGER = logger.get(__name__)
 
 
+class PublishBatch:
+    """
+    Delivery tracking of the messages handed to a single MqttClient.publish call.
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.failed = 0
+        # Unchanged messages not sent at all
+        self.skipped = 0
+        self.latency = None
+        self._pending = 0
+        self._sealed = False
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def complete(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _add(self):
+        with self._lock:
+            self.size += 1
+            self._pending += 1
+
+    def _ack(self, failed=False):
+        with self._lock:
+            self._pending -= 1
+            if failed:
+                self.failed += 1
+            self._check_complete()
+
+    def _seal(self):
+        with self._lock:
+            self._sealed = True
+            self._check_complete()
+
+    def _check_complete(self):
+        if self._sealed and self._pending == 0 and not self._done.is_set():
+            self.latency = time.monotonic() - self._started
+            self._done.set()
+            if self.size:
+                _LOGGER.debug(
+                    "Delivered batch of %d messages (%d failed) in %.1f ms",
+                    self.size,
+                    self.failed,
+                    self.latency * 1000,
+                )
+
+
+class PublishCache:
+    """
+    Remembers the last payload published on each topic, so unchanged state is only
+    republished once its heartbeat elapsed. Policies can be overridden per topic prefix.
+    """
+
+    def __init__(self, enabled, heartbeat, max_topics):
+        self._default_policy = (enabled, heartbeat)
+        self._policies = []
+        self._max_topics = max_topics
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.suppressed = 0
+
+    def add_policy(self, topic_prefix, enabled=None, heartbeat=None):
+        default_enabled, default_heartbeat = self._default_policy
+        self.remove_policy(topic_prefix)
+        self._policies.append((
+            topic_prefix + "/",
+            default_enabled if enabled is None else enabled,
+            default_heartbeat if heartbeat is None else heartbeat,
+        ))
+        # Most specific prefix first
+        self._policies.sort(key=lambda policy: len(policy[0]), reverse=True)
+
+    def remove_policy(self, topic_prefix):
+        self._policies = [policy for policy in self._policies if policy[0] != topic_prefix + "/"]
+
+    def _policy(self, topic):
+        for prefix, enabled, heartbeat in self._policies:
+            if topic.startswith(prefix):
+                return enabled, heartbeat
+        return self._default_policy
+
+    @property
+    def active(self):
+        return self._default_policy[0] or any(enabled for _, enabled, _ in self._policies)
+
+    def should_publish(self, policy_topic, topic, payload):
+        enabled, heartbeat = self._policy(policy_topic)
+        if not enabled:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(topic)
+            if entry is not None and entry[0] == payload and now - entry[1] < heartbeat:
+                self.suppressed += 1
+                return False
+
+            self._entries[topic] = (payload, now)
+            self._entries.move_to_end(topic)
+            if len(self._entries) > self._max_topics:
+                self._entries.popitem(last=False)
+            self.sent += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiscoveryHashes:
+    """
+    Content hashes of the retained discovery configs published, persisted so configs that didn't
+    change aren't sent again after a restart. Hashes older than max_age are ignored, 0 keeps them.
+    """
+
+    def __init__(self, path, max_age=0):
+        self._path = path
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._hashes = self._load()
+
+    def _load(self):
+        try:
+            with open(self._path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _LOGGER.warning("Unable to read discovery hashes from %s, republishing all configs: %s", self._path, e)
+            return {}
+
+    def should_publish(self, topic, payload):
+        digest = hashlib.sha1(payload).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._hashes.get(topic)
+            if entry is not None and entry[0] == digest and (not self._max_age or now - entry[1] < self._max_age):
+                return False
+            self._hashes[topic] = [digest, now]
+            self._dirty = True
+            return True
+
+    def forget(self, topic):
+        with self._lock:
+            if self._hashes.pop(topic, None) is not None:
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            if self._hashes:
+                self._hashes = {}
+                self._dirty = True
+        self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            hashes = json.dumps(self._hashes)
+            self._dirty = False
+
+        tmp_path = self._path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(hashes)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            _LOGGER.warning("Unable to save discovery hashes to %s: %s", self._path, e)
+
+
 class MqttClient:
     def __init__(self, config):
         self._config = config
-        self._mqttc = mqtt.Client(
-            client_id=self.client_id,
-            clean_session=False,
-            userdata={"global_topic_prefix": self.topic_prefix},
-        )
+        self._topics = TopicRegistry(self.topic_prefix)
+        if self.protocol == mqtt.MQTTv5:
+            # Sessions are kept through the session expiry set on connect
+            self._mqttc = mqtt.Client(
+                client_id=self.client_id,
+                protocol=mqtt.MQTTv5,
+                userdata={"global_topic_prefix": self.topic_prefix},
+            )
+        else:
+            self._mqttc = mqtt.Client(
+                client_id=self.client_id,
+                clean_session=False,
+                userdata={"global_topic_prefix": self.topic_prefix},
+            )
 
         if self.username and self.password and not self.client_key:
             self.mqttc.username_pw_set(self.username, self.password)
@@ -30,21 +245,258 @@ class MqttClient:
             self.mqttc.tls_set(self.ca_cert, self.client_cert, self.client_key, cert_reqs=cert_reqs)
             self.mqttc.tls_insecure_set(not self.ca_verify)            
 
+        self._qos = dict(DEFAULT_QOS)
+        self._qos.update(self.qos)
+
         if self.availability_topic:
             topic = self._format_topic(self.availability_topic)
-            _LOGGER.debug("Setting LWT to: %s" % topic)
-            self.mqttc.will_set(topic, payload=LWT_OFFLINE, retain=True)
+            _LOGGER.debug("Setting LWT to: %s", topic)
+            self.mqttc.will_set(
+                topic, payload=LWT_OFFLINE, qos=self._qos[MESSAGE_CLASS_AVAILABILITY], retain=True
+            )
 
-    def publish(self, messages):
+        self._publish_cache = PublishCache(
+            self.publish_on_change, self.publish_heartbeat, self.publish_cache_size
+        )
+        self._discovery_hashes = (
+            DiscoveryHashes(self.discovery_cache, self.discovery_cache_max_age)
+            if self.discovery_cache
+            else None
+        )
+
+        # Messages handed to paho but not yet written (QoS 0) or acknowledged (QoS 1 and 2), by mid
+        self._inflight = {}
+        # Acknowledgements that came before publish() got to track the message, only kept briefly
+        self._early_acks = OrderedDict()
+        self._inflight_condition = threading.Condition()
+        self.mqttc.max_inflight_messages_set(self.inflight_window)
+        self.mqttc.max_queued_messages_set(self.max_queued_messages)
+        self.mqttc.on_publish = self._on_publish
+        self.mqttc.on_disconnect = self._on_disconnect
+
+        # While the broker is unreachable, and until the spool is drained, messages go to disk. Before the
+        # first connection they are left to paho, which sends them right after connecting
+        self._connected = False
+        self._was_connected = False
+        self._spool = MessageSpool(self.spool_dir, self.spool_max_bytes) if self.spool_dir else None
+        self._spool_lock = threading.Lock()
+        self._drain_thread = None
+
+        # MQTT 5 topic aliases of state topics, valid for the current connection only
+        self._topic_alias_maximum = 0
+        self._topic_aliases = {}
+        self._alias_properties = {}
+        self._alias_lock = threading.Lock()
+        self._state_properties = None
+        if self.protocol == mqtt.MQTTv5 and self.message_expiry:
+            self._state_properties = self._publish_properties()
+
+    def publish(self, messages, block=True):
+        """
+        Publish a batch of messages. Unless block is False, waits for room in the in-flight window
+        before handing each message to paho. Returns a PublishBatch tracking their delivery.
+        """
+        batch = PublishBatch()
         if not messages:
-            return
+            batch._seal()
+            return batch
 
+        use_cache = self._publish_cache.active
         for m in messages:
             if m.use_global_prefix:
                 topic = self._format_topic(m.topic)
             else:
                 topic = m.topic
-            self.mqttc.publish(topic, m.payload, retain=m.retain)
+            payload = m.payload
+            if use_cache and m.use_publish_cache and not self._publish_cache.should_publish(m.topic, topic, payload):
+                batch.skipped += 1
+                continue
+            # Only retained configs outlive their publishing on the broker
+            hashed = self._discovery_hashes is not None and m.message_class == MESSAGE_CLASS_DISCOVERY and m.retain
+            if hashed and not self._discovery_hashes.should_publish(topic, payload):
+                batch.skipped += 1
+                continue
+
+            qos = self._qos[m.message_class] if m.qos is None else m.qos
+            batch._add()
+            if self._spool_message(m, topic, payload, qos):
+                batch._ack()
+                continue
+
+            # Nothing frees the window while disconnected, messages are spooled or queued by paho meanwhile
+            if block and self._connected:
+                self._wait_for_window()
+            info = self._send(topic, payload, qos, m.retain, m.message_class)
+            if hashed and info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self._discovery_hashes.forget(topic)
+            self._track(info, qos, batch)
+
+        if self._discovery_hashes is not None:
+            self._discovery_hashes.save()
+        batch._seal()
+        return batch
+
+    def _send(self, topic, payload, qos, retain, message_class=None):
+        # Only volatile state gets MQTT 5 properties, anything else is published as it is
+        if (self._state_properties is None and not self._topic_alias_maximum) or (
+            message_class != MESSAGE_CLASS_STATE or retain
+        ):
+            return self.mqttc.publish(topic, payload, qos=qos, retain=retain)
+        # QoS 1 and 2 messages may be held back by paho, never let them set up an alias
+        if qos != 0 or not self._topic_alias_maximum:
+            return self.mqttc.publish(topic, payload, qos=qos, retain=retain, properties=self._state_properties)
+
+        with self._alias_lock:
+            alias = self._topic_aliases.get(topic)
+            if alias is not None:
+                return self.mqttc.publish("", payload, qos=qos, retain=retain, properties=self._alias_properties[alias])
+            if len(self._topic_aliases) >= self._topic_alias_maximum:
+                return self.mqttc.publish(topic, payload, qos=qos, retain=retain, properties=self._state_properties)
+
+            alias = len(self._topic_aliases) + 1
+            if alias not in self._alias_properties:
+                self._alias_properties[alias] = self._publish_properties(alias)
+            info = self.mqttc.publish(topic, payload, qos=qos, retain=retain, properties=self._alias_properties[alias])
+            # The broker only knows the alias once the message carrying it was sent
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self._topic_aliases[topic] = alias
+            return info
+
+    def _publish_properties(self, alias=None):
+        properties = Properties(PacketTypes.PUBLISH)
+        if self.message_expiry:
+            properties.MessageExpiryInterval = self.message_expiry
+        if alias is not None:
+            properties.TopicAlias = alias
+        return properties
+
+    def _reset_topic_aliases(self, maximum=0):
+        with self._alias_lock:
+            self._topic_aliases.clear()
+            self._topic_alias_maximum = maximum
+
+    def _spool_message(self, message, topic, payload, qos):
+        # Availability is only meaningful live, the LWT covers the broker being unreachable
+        if self._spool is None or message.message_class == MESSAGE_CLASS_AVAILABILITY:
+            return False
+
+        with self._spool_lock:
+            if not self._spool.pending and (self._connected or not self._was_connected):
+                return False
+            self._spool.append(topic, payload, qos, message.retain)
+            return True
+
+    def _start_drain(self):
+        with self._spool_lock:
+            if not self._spool.pending or (self._drain_thread and self._drain_thread.is_alive()):
+                return
+            self._drain_thread = threading.Thread(target=self._drain_spool, name="spool-drain", daemon=True)
+            self._drain_thread.start()
+
+    def _drain_spool(self):
+        batch = PublishBatch()
+        interval = 1 / self.spool_drain_rate if self.spool_drain_rate else 0
+        next_send = time.monotonic()
+
+        def send(topic, payload, qos, retain):
+            nonlocal next_send
+            if not self._connected:
+                return False
+
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_send = max(next_send, time.monotonic()) + interval
+
+            self._wait_for_window()
+            batch._add()
+            self._track(self.mqttc.publish(topic, payload, qos=qos, retain=retain), qos, batch)
+            return True
+
+        _LOGGER.info("Replaying %d spooled messages", self._spool.pending)
+        while self._connected:
+            if self._spool.replay(send, self.spool_replay, self.spool_max_age):
+                with self._spool_lock:
+                    # Nothing was spooled meanwhile, new messages can be published directly again
+                    if not self._spool.pending:
+                        break
+        batch._seal()
+        _LOGGER.info("Replayed %d spooled messages (%d failed)", batch.size, batch.failed)
+
+    def _wait_for_window(self):
+        with self._inflight_condition:
+            if not self._inflight_condition.wait_for(
+                lambda: not self._connected or len(self._inflight) < self.inflight_window, self.publish_timeout
+            ):
+                _LOGGER.debug("In-flight window still full after %d seconds, publishing anyway", self.publish_timeout)
+
+    def _track(self, info, qos, batch):
+        # Messages paho couldn't send aren't tracked: QoS 0 ones are dropped while disconnected, higher ones
+        # are queued and only delivered after reconnecting, unconfirmed on this connection. Messages handed
+        # to paho while disconnected aren't tracked either, it queues them and the window would fill up
+        # during an outage. Checked under the lock, _on_disconnect releases the window after clearing _connected
+        with self._inflight_condition:
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                failed = True
+            elif not self._connected:
+                failed = False
+            elif info.mid in self._early_acks:
+                del self._early_acks[info.mid]
+                failed = False
+            else:
+                self._inflight[info.mid] = (batch, qos)
+                return
+        batch._ack(failed=failed)
+
+    # noinspection PyUnusedLocal
+    def _on_publish(self, client, userdata, mid):
+        with self._inflight_condition:
+            entry = self._inflight.pop(mid, None)
+            if entry is None:
+                # Acknowledged before publish() got to track it, or no longer tracked since a disconnect
+                self._early_acks[mid] = None
+                if len(self._early_acks) > self.inflight_window:
+                    self._early_acks.popitem(last=False)
+                return
+            self._inflight_condition.notify()
+        entry[0]._ack()
+
+    # noinspection PyUnusedLocal
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        self._connected = False
+        self._reset_topic_aliases()
+        # Unsent QoS 0 messages are discarded by paho on reconnect, higher ones are redelivered by paho but
+        # not tracked any longer, the window would stay full while disconnected otherwise
+        with self._inflight_condition:
+            batches = [batch for batch, _ in self._inflight.values()]
+            self._inflight.clear()
+            self._early_acks.clear()
+            self._inflight_condition.notify_all()
+        for batch in batches:
+            batch._ack(failed=True)
+
+    def add_publish_policy(self, topic_prefix, enabled=None, heartbeat=None):
+        self._publish_cache.add_policy(topic_prefix, enabled, heartbeat)
+
+    def register_topics(self, topics):
+        """
+        Build the prefixed topics of configured devices once, publishing only looks them up
+        """
+        if self.topic_prefix:
+            for topic in topics:
+                self._topics.register(topic)
+
+    def remove_publish_policy(self, topic_prefix):
+        self._publish_cache.remove_policy(topic_prefix)
+
+    def reset_publish_cache(self):
+        if self._publish_cache.active:
+            _LOGGER.info(
+                "Publish cache: %d messages sent, %d unchanged suppressed",
+                self._publish_cache.sent,
+                self._publish_cache.suppressed,
+            )
+        self._publish_cache.clear()
 
     @property
     def client_id(self):
@@ -97,6 +549,81 @@ class MqttClient:
     def topic_prefix(self):
         return self._config["topic_prefix"] if "topic_prefix" in self._config else None
 
+    @property
+    def protocol(self):
+        return mqtt.MQTTv5 if str(self._config.get("protocol", "3.1.1")) in ("5", "5.0") else mqtt.MQTTv311
+
+    @property
+    def session_expiry(self):
+        return self._config.get("session_expiry", DEFAULT_SESSION_EXPIRY)
+
+    @property
+    def message_expiry(self):
+        return self._config.get("message_expiry", DEFAULT_MESSAGE_EXPIRY)
+
+    @property
+    def topic_aliases(self):
+        return self._config.get("topic_aliases", 65535)
+
+    @property
+    def publish_on_change(self):
+        return bool(self._config.get("publish_on_change", False))
+
+    @property
+    def publish_heartbeat(self):
+        return self._config.get("publish_heartbeat", DEFAULT_PUBLISH_HEARTBEAT)
+
+    @property
+    def publish_cache_size(self):
+        return self._config.get("publish_cache_size", DEFAULT_PUBLISH_CACHE_SIZE)
+
+    @property
+    def qos(self):
+        qos = self._config.get("qos", {})
+        if isinstance(qos, int):
+            return {message_class: qos for message_class in DEFAULT_QOS}
+        return qos
+
+    @property
+    def inflight_window(self):
+        return self._config.get("inflight_window", DEFAULT_INFLIGHT_WINDOW)
+
+    @property
+    def max_queued_messages(self):
+        return self._config.get("max_queued_messages", 0)
+
+    @property
+    def publish_timeout(self):
+        return self._config.get("publish_timeout", DEFAULT_PUBLISH_TIMEOUT)
+
+    @property
+    def discovery_cache(self):
+        return self._config.get("discovery_cache")
+
+    @property
+    def discovery_cache_max_age(self):
+        return self._config.get("discovery_cache_max_age", 0)
+
+    @property
+    def spool_dir(self):
+        return self._config.get("spool_dir")
+
+    @property
+    def spool_max_bytes(self):
+        return self._config.get("spool_max_bytes", DEFAULT_MAX_BYTES)
+
+    @property
+    def spool_replay(self):
+        return self._config.get("spool_replay", REPLAY_ALL)
+
+    @property
+    def spool_max_age(self):
+        return self._config.get("spool_max_age", 0)
+
+    @property
+    def spool_drain_rate(self):
+        return self._config.get("spool_drain_rate", DEFAULT_SPOOL_DRAIN_RATE)
+
     @property
     def availability_topic(self):
         return (
@@ -110,78 +637,252 @@ class MqttClient:
         return self._mqttc
 
     # noinspection PyUnusedLocal
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        # The broker may have lost non retained state while we were away
+        self._publish_cache.clear()
+        if rc == mqtt.CONNACK_ACCEPTED:
+            if self.topic_aliases and properties is not None and hasattr(properties, "TopicAliasMaximum"):
+                self._reset_topic_aliases(min(properties.TopicAliasMaximum, self.topic_aliases))
+            self._connected = True
+            self._was_connected = True
+            if self._discovery_hashes is not None and not flags.get("session present"):
+                # The broker lost our session, likely its retained configs as well
+                self._discovery_hashes.clear()
+            if self._spool is not None:
+                self._start_drain()
         if self.availability_topic:
+            # Called from the network loop, which has to keep running to free the in-flight window
             self.publish(
                 [
                     MqttMessage(
-                        topic=self.availability_topic, payload=LWT_ONLINE, retain=True
+                        topic=self.availability_topic, payload=LWT_ONLINE, retain=True,
+                        message_class=MESSAGE_CLASS_AVAILABILITY,
                     )
-                ]
+                ],
+                block=False,
             )
 
-    def callbacks_subscription(self, callbacks):
+    def callbacks_subscription(self, callbacks, connect_async=False):
+        """
+        Connect and subscribe the callbacks. With connect_async the connection is left to the network loop,
+        which keeps retrying while the broker is unreachable.
+        """
         self.mqttc.on_connect = self.on_connect
 
-        self.mqttc.connect(self.hostname, port=self.port)
+        connect = self.mqttc.connect_async if connect_async else self.mqttc.connect
+        if self.protocol == mqtt.MQTTv5:
+            properties = Properties(PacketTypes.CONNECT)
+            properties.SessionExpiryInterval = self.session_expiry
+            connect(self.hostname, port=self.port, clean_start=False, properties=properties)
+        else:
+            connect(self.hostname, port=self.port)
 
         for topic, callback in callbacks:
-            topic = self._format_topic(topic)
-            _LOGGER.debug("Subscribing to: %s" % topic)
-            self.mqttc.message_callback_add(topic, callback)
-            self.mqttc.subscribe(topic)
+            self.subscribe(topic, callback)
 
         self.mqttc.loop_start()
 
+    def subscribe(self, topic, callback):
+        topic = self._format_topic(topic)
+        _LOGGER.debug("Subscribing to: %s", topic)
+        self.mqttc.message_callback_add(topic, callback)
+        self.mqttc.subscribe(topic)
+
+    def unsubscribe(self, topic):
+        topic = self._format_topic(topic)
+        _LOGGER.debug("Unsubscribing from: %s", topic)
+        self.mqttc.unsubscribe(topic)
+        self.mqttc.message_callback_remove(topic)
+
     def __del__(self):
         if self.availability_topic:
             self.publish(
                 [
                     MqttMessage(
-                        topic=self.availability_topic, payload=LWT_OFFLINE, retain=True
+                        topic=self.availability_topic, payload=LWT_OFFLINE, retain=True,
+                        message_class=MESSAGE_CLASS_AVAILABILITY,
                     )
-                ]
+                ],
+                block=False,
             )
 
     def _format_topic(self, topic):
-        return "{}/{}".format(self.topic_prefix, topic) if self.topic_prefix else topic
+        return self._topics.topic(topic) if self.topic_prefix else topic
+
+
+class BrokerForwarder:
+    """
+    Additional broker fed with copies of the published messages matching its topic filter.
+    Messages are queued and published by a thread of its own, so a slow or unreachable broker
+    doesn't hold the others up. Batches are dropped while the queue is full.
+    """
+
+    def __init__(self, config):
+        config = dict(config)
+        topic_filter = config.pop("topic_filter", None) or []
+        self._topic_filters = [topic_filter] if isinstance(topic_filter, str) else list(topic_filter)
+        self._queue = queue.Queue(config.pop("queue_size", DEFAULT_BROKER_QUEUE_SIZE))
+        self.client = MqttClient(config)
+        self.dropped = 0
+        self._dropping = False
+        self._thread = threading.Thread(
+            target=self._run, name="mqtt-{}".format(self.client.hostname), daemon=True
+        )
+
+    def accepts(self, topic):
+        if not self._topic_filters:
+            return True
+        return any(mqtt.topic_matches_sub(topic_filter, topic) for topic_filter in self._topic_filters)
+
+    def forward(self, messages):
+        messages = [m for m in messages if self.accepts(m.topic)]
+        if not messages:
+            return
+
+        try:
+            self._queue.put_nowait(messages)
+        except queue.Full:
+            if not self._dropping:
+                _LOGGER.warning("Publish queue of %s is full, dropping messages", self.client.hostname)
+                self._dropping = True
+            self.dropped += len(messages)
+        else:
+            if self._dropping:
+                _LOGGER.info("Publish queue of %s accepts messages again, %d dropped so far", self.client.hostname, self.dropped)
+                self._dropping = False
+
+    def start(self):
+        # An unreachable additional broker must not keep the gateway from starting
+        try:
+            self.client.callbacks_subscription([], connect_async=True)
+        except Exception as e:
+            logger.log_exception(
+                _LOGGER,
+                "Unable to connect to %s: %s",
+                self.client.hostname,
+                e,
+                key=(self.client.hostname, type(e).__name__),
+            )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            messages = self._queue.get()
+            try:
+                self.client.publish(messages)
+            except Exception as e:
+                logger.log_exception(
+                    _LOGGER,
+                    "Error publishing to %s: %s",
+                    self.client.hostname,
+                    type(e).__name__,
+                    key=(self.client.hostname, type(e).__name__),
+                )
+
+
+class MqttFanout:
+    """
+    Publishes to the primary MqttClient and forwards copies to additional brokers, the publish policies
+    of the workers apply to all of them. Everything else, like command subscriptions, is handled by the
+    primary client.
+    """
+
+    def __init__(self, primary, forwarders):
+        self._primary = primary
+        self._forwarders = forwarders
+
+    def publish(self, messages, block=True):
+        if messages:
+            for forwarder in self._forwarders:
+                forwarder.forward(messages)
+        return self._primary.publish(messages, block)
+
+    def callbacks_subscription(self, callbacks):
+        self._primary.callbacks_subscription(callbacks)
+        for forwarder in self._forwarders:
+            forwarder.start()
+
+    def register_topics(self, topics):
+        for client in self._clients():
+            client.register_topics(topics)
+
+    # Publish policies of the workers apply to every broker
+    def add_publish_policy(self, topic_prefix, enabled=None, heartbeat=None):
+        for client in self._clients():
+            client.add_publish_policy(topic_prefix, enabled, heartbeat)
+
+    def remove_publish_policy(self, topic_prefix):
+        for client in self._clients():
+            client.remove_publish_policy(topic_prefix)
+
+    def reset_publish_cache(self):
+        for client in self._clients():
+            client.reset_publish_cache()
+
+    def _clients(self):
+        return [self._primary] + [forwarder.client for forwarder in self._forwarders]
+
+    def __getattr__(self, name):
+        return getattr(self._primary, name)
+
+
+def create_client(config):
+    """
+    MqttClient of the mqtt settings, fanning out to the additional brokers listed in them if any
+    """
+    brokers = config.get("brokers") or []
+    primary = MqttClient({key: value for key, value in config.items() if key != "brokers"})
+    if not brokers:
+        return primary
+
+    _LOGGER.info("Forwarding messages to %d additional brokers", len(brokers))
+    return MqttFanout(primary, [BrokerForwarder(broker) for broker in brokers])
 
 
 class MqttMessage:
-    use_global_prefix = True
+    __slots__ = ("topic", "retain", "qos", "_payload", "_encoded", "_message_class")
 
-    def __init__(self, topic=None, payload=None, retain=False):
-        self._topic = topic
+    use_global_prefix = True
+    use_publish_cache = True
+    default_message_class = MESSAGE_CLASS_STATE
+
+    def __init__(self, topic=None, payload=None, retain=False, qos=None, message_class=None):
+        self.topic = topic
+        self.retain = retain
+        # QoS of the message class configured for the client is used when not given
+        self.qos = qos
         self._payload = payload
-        self._retain = retain
+        self._encoded = None
+        self._message_class = message_class
 
     @property
-    def topic(self):
-        return self._topic
-
-    @topic.setter
-    def topic(self, new_topic):
-        self._topic = new_topic
+    def message_class(self):
+        if self._message_class is None:
+            return self.default_message_class
+        return self._message_class
 
     @property
     def payload(self):
-        if isinstance(self.raw_payload, str):
-            return self.raw_payload
-        else:
-            return json.dumps(self.raw_payload)
+        """
+        Payload encoded as bytes, serialized on first access only.
+        Strings are utf-8 encoded, bytes are sent as they are and anything else as JSON.
+        """
+        if self._encoded is None:
+            payload = self._payload
+            if isinstance(payload, bytes):
+                self._encoded = payload
+            elif isinstance(payload, (bytearray, memoryview)):
+                self._encoded = bytes(payload)
+            elif isinstance(payload, str):
+                self._encoded = payload.encode("utf-8")
+            else:
+                self._encoded = encoder.dumpb(payload)
+        return self._encoded
 
     @property
     def raw_payload(self):
         return self._payload
 
-    @property
-    def retain(self):
-        return self._retain
-
-    @retain.setter
-    def retain(self, new_retain):
-        self._retain = new_retain
-
     @property
     def as_dict(self):
         return {"topic": self.topic, "payload": self.payload}
@@ -200,7 +901,11 @@ class MqttConfigMessage(MqttMessage):
     COVER = "cover"
     SWITCH = "switch"
 
+    __slots__ = ()
+
     use_global_prefix = False
+    use_publish_cache = False
+    default_message_class = MESSAGE_CLASS_DISCOVERY
 
-    def __init__(self, component, name, payload=None, retain=False):
-        super().__init__("{}/{}/config".format(component, name), payload, retain)
+    def __init__(self, component, name, payload=None, retain=False, qos=None):
+        super().__init__("{}/{}/config".format(component, name), payload, retain, qos)
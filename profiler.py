@@ -0,0 +1,268 @@
+"""
+Startup profiling for --profile-startup: wall time of the startup phases and the import cost of every module,
+reported as JSON so it can be compared between releases.
+Only the standard library is imported here, it has to be installed before anything else is imported.
+"""
+import copy
+import importlib.abc
+import json
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_DEVICES = 10
+
+_STARTED = time.perf_counter()
+_PHASES = []
+_IMPORT_TIMER = None
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """
+    Meta path hook timing the execution of every module imported while installed.
+    Cumulative time includes the modules it imported in turn, self time doesn't.
+    """
+
+    def __init__(self):
+        # module name -> [cumulative seconds, self seconds]
+        self.timings = {}
+        self._local = threading.local()
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, self)
+        return spec
+
+    def _start(self, name):
+        stack = self._stack()
+        if stack and stack[-1][0] == name:
+            return
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def _finish(self, name):
+        stack = self._stack()
+        if not stack or stack[-1][0] != name:
+            return
+        _, started, children = stack.pop()
+        elapsed = time.perf_counter() - started
+        self.timings[name] = [elapsed, elapsed - children]
+        if stack:
+            stack[-1][2] += elapsed
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, timer):
+        self._loader = loader
+        self._timer = timer
+
+    def create_module(self, spec):
+        # Extension modules do their work here
+        self._timer._start(spec.name)
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        name = module.__spec__.name
+        self._timer._start(name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer._finish(name)
+            # The module keeps its own loader
+            module.__loader__ = self._loader
+            module.__spec__.loader = self._loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+def install():
+    global _IMPORT_TIMER
+    if _IMPORT_TIMER is None:
+        _IMPORT_TIMER = ImportTimer()
+        sys.meta_path.insert(0, _IMPORT_TIMER)
+
+
+def uninstall():
+    if _IMPORT_TIMER is not None and _IMPORT_TIMER in sys.meta_path:
+        sys.meta_path.remove(_IMPORT_TIMER)
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a startup phase, only recorded while profiling. A phase raising is recorded with its error.
+    """
+    if _IMPORT_TIMER is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = "{}: {}".format(type(e).__name__, e)
+        raise
+    finally:
+        _PHASES.append((name, time.perf_counter() - started, error))
+
+
+def fake_settings(settings, devices):
+    """
+    Settings of the configured workers, each with the given number of fake devices
+    """
+    settings = copy.deepcopy(settings)
+    for worker_config in settings["manager"]["workers"].values():
+        args = (worker_config or {}).get("args") or {}
+        if not isinstance(args.get("devices"), dict) or not args["devices"]:
+            continue
+
+        template = next(iter(args["devices"].values()))
+        fake_devices = {}
+        for index in range(devices):
+            mac = "00:00:00:00:{:02X}:{:02X}".format(index // 256, index % 256)
+            if isinstance(template, dict):
+                device = copy.deepcopy(template)
+                device["mac"] = mac
+            else:
+                device = mac
+            fake_devices["device_{}".format(index)] = device
+        args["devices"] = fake_devices
+    return settings
+
+
+def run(devices=DEFAULT_DEVICES):
+    """
+    Go through the startup of the configured workers with fake devices, without connecting to MQTT.
+    Unsatisfied requirements and failing workers are part of the report, it is always produced.
+    :return: report
+    """
+    import workers_requirements
+    from config import load_settings, manager_config
+    from workers_manager import WorkersManager
+
+    with phase("settings"):
+        settings = fake_settings(load_settings(), devices)
+        config = manager_config(settings["manager"])
+
+    requirement_errors = []
+    with phase("requirements"):
+        for requirement in sorted(workers_requirements.configured_workers()):
+            try:
+                error = workers_requirements._check_requirement(requirement)
+            except ValueError as e:
+                error = str(e)
+            if error:
+                requirement_errors.append(error)
+
+    manager = WorkersManager(config, _OfflineMqtt(settings["mqtt"]))
+    manager._global_topic_prefix = settings["mqtt"].get("topic_prefix")
+    for worker_config in config.workers:
+        try:
+            with phase("setup.{}".format(worker_config.name)):
+                manager._registrations[worker_config.name] = manager._register_worker(
+                    worker_config, config.sensor_config
+                )
+        except Exception:
+            # Recorded as a failed phase
+            continue
+
+    for registration in manager._registrations.values():
+        if registration.config_timeout is None:
+            continue
+        try:
+            with phase("discovery.{}".format(registration.config.name)):
+                messages = registration.worker_obj.config(manager._mqtt.availability_topic)
+                if not isinstance(messages, list):
+                    messages = [message for batch in messages for message in batch]
+                for message in messages:
+                    message.payload
+        except Exception:
+            continue
+
+    for registration in manager._registrations.values():
+        if hasattr(registration.worker_obj, "stop"):
+            try:
+                registration.worker_obj.stop()
+            except Exception:
+                pass
+    uninstall()
+    return report(devices, requirement_errors)
+
+
+def report(devices=None, requirement_errors=()):
+    timings = _IMPORT_TIMER.timings if _IMPORT_TIMER is not None else {}
+    phases = []
+    for name, elapsed, error in _PHASES:
+        entry = {"name": name, "ms": round(elapsed * 1000, 3)}
+        if error is not None:
+            entry["error"] = error
+        phases.append(entry)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "devices_per_worker": devices,
+        "total_ms": round((time.perf_counter() - _STARTED) * 1000, 3),
+        "requirement_errors": list(requirement_errors),
+        "phases": phases,
+        "imports": [
+            {"module": name, "cumulative_ms": round(cumulative * 1000, 3), "self_ms": round(own * 1000, 3)}
+            for name, (cumulative, own) in sorted(timings.items(), key=lambda item: item[1][1], reverse=True)
+        ],
+    }
+
+
+def write(report_data, path="-"):
+    if path == "-":
+        json.dump(report_data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(path, "w") as f:
+            json.dump(report_data, f, indent=2)
+
+
+class _OfflineMqtt:
+    """
+    Stands in for the MqttClient while profiling, nothing is sent
+    """
+
+    def __init__(self, config):
+        self.availability_topic = config.get("availability_topic")
+
+    def add_publish_policy(self, topic_prefix, enabled=None, heartbeat=None):
+        pass
+
+    def remove_publish_policy(self, topic_prefix):
+        pass
+
+    def register_topics(self, topics):
+        pass
+
+    def subscribe(self, topic, callback):
+        pass
+
+    def unsubscribe(self, topic):
+        pass
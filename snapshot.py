@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+import time
+
+import logger
+
+_LOGGER = logger.get(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class StateSnapshot:
+    """
+    Runtime state of the workers persisted across restarts, e.g. last seen times and optimistic states,
+    keyed by worker name. Saved atomically, and only when it changed.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._saved = None
+        self._states = self._load()
+
+    def _load(self):
+        try:
+            with open(self._path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _LOGGER.warning("Unable to read worker state snapshot from %s, starting cold: %s", self._path, e)
+            return {}
+
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            _LOGGER.warning("Ignoring worker state snapshot %s of an unsupported version", self._path)
+            return {}
+        _LOGGER.info(
+            "Loaded worker state snapshot of %d workers, saved %.0f seconds ago",
+            len(data.get("workers", {})),
+            time.time() - data.get("saved_at", 0),
+        )
+        return data.get("workers", {})
+
+    def pop(self, name):
+        """
+        :return: state saved for the worker, only handed out once
+        """
+        with self._lock:
+            return self._states.pop(name, None)
+
+    def save(self, states):
+        workers = json.dumps(states, sort_keys=True)
+        with self._lock:
+            if workers == self._saved:
+                return
+
+            tmp_path = self._path + ".tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump({"version": SNAPSHOT_VERSION, "saved_at": time.time(), "workers": states}, f)
+                    # The snapshot is only replaced by one that made it to disk
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self._path)
+            except OSError as e:
+                _LOGGER.warning("Unable to save worker state snapshot to %s: %s", self._path, e)
+                return
+            self._saved = workers
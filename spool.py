@@ -0,0 +1,237 @@
+"""
+Store-and-forward spool of outgoing MQTT messages.
+
+Messages are appended to a log of segment files while the broker can't be reached and replayed
+in order once it is back. Every record carries its length and crc32, so a record torn by a crash
+is detected and cut off when the spool is opened again.
+"""
+import glob
+import os
+import struct
+import threading
+import time
+import zlib
+
+import logger
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_SEGMENT_BYTES = 1024 * 1024
+REPLAY_ALL = "all"
+REPLAY_LATEST = "latest"
+
+# Record: body length, crc32 of the body
+_RECORD_HEADER = struct.Struct("<II")
+# Body: creation time, qos, retain, topic length, then topic and payload
+_BODY_HEADER = struct.Struct("<dBBH")
+_SEGMENT_SUFFIX = ".seg"
+
+_LOGGER = logger.get(__name__)
+
+
+class _Segment:
+    def __init__(self, path, sequence, size=0, records=0):
+        self.path = path
+        self.sequence = sequence
+        self.size = size
+        self.records = records
+        # Replay position, kept in memory only: after a restart a segment is replayed from its start
+        self.read_offset = 0
+        self.consumed = 0
+
+    @property
+    def pending(self):
+        return self.records - self.consumed
+
+
+class MessageSpool:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, segment_bytes=DEFAULT_SEGMENT_BYTES):
+        self._path = path
+        self._max_bytes = max_bytes
+        # Keep a few segments, the oldest one is dropped at once when the spool is full
+        self._segment_bytes = min(segment_bytes, max(max_bytes // 4, 1))
+        self._lock = threading.Lock()
+        self._segments = []
+        self._writer = None
+        self.dropped = 0
+
+        os.makedirs(path, exist_ok=True)
+        self._recover()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return sum(segment.pending for segment in self._segments)
+
+    @property
+    def size(self):
+        with self._lock:
+            return sum(segment.size for segment in self._segments)
+
+    def append(self, topic, payload, qos=0, retain=False, created=None):
+        encoded_topic = topic.encode("utf-8")
+        body = _BODY_HEADER.pack(
+            time.time() if created is None else created, qos, bool(retain), len(encoded_topic)
+        ) + encoded_topic + payload
+        record = _RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+        with self._lock:
+            if not self._make_room(len(record)):
+                self.dropped += 1
+                _LOGGER.warning("Message for %s is larger than the spool, dropping it", topic)
+                return False
+
+            active = self._segments[-1]
+            if active.size and active.size + len(record) > self._segment_bytes:
+                active = self._rotate()
+
+            self._writer.write(record)
+            # Flushed to the OS right away, so spooled messages survive the gateway crashing
+            self._writer.flush()
+            active.size += len(record)
+            active.records += 1
+            return True
+
+    def replay(self, send, replay=REPLAY_ALL, max_age=0):
+        """
+        Replay spooled messages oldest first, calling send(topic, payload, qos, retain) for each.
+        With REPLAY_LATEST only the last message of every topic is sent, messages older than
+        max_age seconds are skipped. Stops as soon as send returns False.
+        :return: True when everything spooled before the call was replayed
+        """
+        with self._lock:
+            if self._segments[-1].records:
+                self._rotate()
+            segments = self._segments[:-1]
+
+        latest = self._index_latest(segments) if replay == REPLAY_LATEST else None
+        cutoff = time.time() - max_age if max_age else None
+
+        for segment in segments:
+            for offset, end, (created, qos, retain, topic, payload) in self._read(segment):
+                skip = (cutoff is not None and created < cutoff) or (
+                    latest is not None and latest[topic] != (segment.sequence, offset)
+                )
+                if not skip and not send(topic, payload, qos, retain):
+                    return False
+                segment.read_offset = end
+                segment.consumed += 1
+            self._remove(segment)
+
+        return True
+
+    def _make_room(self, record_size):
+        if record_size > self._max_bytes:
+            return False
+
+        size = sum(segment.size for segment in self._segments)
+        while size + record_size > self._max_bytes and len(self._segments) > 1:
+            segment = self._segments.pop(0)
+            size -= segment.size
+            self.dropped += segment.pending
+            _LOGGER.warning("Spool is full, dropped %d oldest messages", segment.pending)
+            self._unlink(segment)
+
+        if size + record_size > self._max_bytes:
+            # Only the active segment is left, start over with an empty one
+            self._rotate()
+            return self._make_room(record_size)
+        return True
+
+    def _rotate(self):
+        sequence = self._segments[-1].sequence + 1 if self._segments else 0
+        segment = _Segment(os.path.join(self._path, "{:08d}{}".format(sequence, _SEGMENT_SUFFIX)), sequence)
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = open(segment.path, "ab")
+        self._segments.append(segment)
+        return segment
+
+    def _remove(self, segment):
+        with self._lock:
+            if segment in self._segments:
+                self._segments.remove(segment)
+                self._unlink(segment)
+
+    @staticmethod
+    def _unlink(segment):
+        try:
+            os.remove(segment.path)
+        except OSError as e:
+            _LOGGER.warning("Unable to remove spool segment %s: %s", segment.path, e)
+
+    def _index_latest(self, segments):
+        latest = {}
+        for segment in segments:
+            for offset, _, (_, _, _, topic, _) in self._read(segment):
+                latest[topic] = (segment.sequence, offset)
+        return latest
+
+    @staticmethod
+    def _read(segment):
+        try:
+            f = open(segment.path, "rb")
+        except FileNotFoundError:
+            # Dropped because the spool was full
+            return
+
+        with f:
+            offset = segment.read_offset
+            f.seek(offset)
+            while True:
+                record = MessageSpool._read_record(f)
+                if record is None:
+                    return
+                end = f.tell()
+                yield offset, end, record
+                offset = end
+
+    @staticmethod
+    def _read_record(f):
+        header = f.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            return None
+        length, crc = _RECORD_HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length or zlib.crc32(body) != crc or length < _BODY_HEADER.size:
+            return None
+
+        created, qos, retain, topic_length = _BODY_HEADER.unpack_from(body)
+        topic_end = _BODY_HEADER.size + topic_length
+        topic = body[_BODY_HEADER.size:topic_end].decode("utf-8")
+        return created, qos, bool(retain), topic, body[topic_end:]
+
+    def _recover(self):
+        paths = sorted(glob.glob(os.path.join(self._path, "*" + _SEGMENT_SUFFIX)))
+        for path in paths:
+            try:
+                sequence = int(os.path.basename(path)[: -len(_SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+
+            records = valid_size = 0
+            with open(path, "rb+") as f:
+                while self._read_record(f) is not None:
+                    records += 1
+                    valid_size = f.tell()
+                if valid_size < os.fstat(f.fileno()).st_size:
+                    _LOGGER.warning("Cutting off torn record at the end of spool segment %s", path)
+                    f.truncate(valid_size)
+
+            if records:
+                self._segments.append(_Segment(path, sequence, valid_size, records))
+            else:
+                os.remove(path)
+
+        if self._segments:
+            _LOGGER.info(
+                "Recovered %d spooled messages from %s",
+                sum(segment.records for segment in self._segments),
+                self._path,
+            )
+        self._rotate()
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,74 @@
+import sys
+import threading
+import types
+
+import pytest
+
+from workers.am43 import Am43Worker
+
+
+class FakeShade:
+    def __init__(self, mac, pin, **kwargs):
+        self.mac = mac
+        self.connected = False
+
+    def __enter__(self):
+        self.connected = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connected = False
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setitem(sys.modules, "Zemismart", types.SimpleNamespace(Zemismart=FakeShade))
+    worker = Am43Worker(
+        10, 0, 0, None,
+        topic_prefix="blinds",
+        devices={
+            "kitchen": {"mac": "00:00:00:00:00:01", "pin": 8888},
+            "office": {"mac": "00:00:00:00:00:02", "pin": 8888},
+        },
+    )
+    yield worker
+    worker.stop()
+
+
+def test_blocked_blind_does_not_hold_up_others(worker):
+    entered = threading.Event()
+    release = threading.Event()
+
+    def stuck():
+        with worker._shade_session(worker.devices["kitchen"]):
+            entered.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=stuck)
+    thread.start()
+    try:
+        assert entered.wait(5)
+        done = threading.Event()
+
+        def other():
+            with worker._shade_session(worker.devices["office"]) as shade:
+                assert shade.connected
+            done.set()
+
+        threading.Thread(target=other).start()
+        assert done.wait(2)
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_idle_session_is_reused_and_closed_on_stop(worker):
+    with worker._shade_session(worker.devices["kitchen"]) as first:
+        pass
+    with worker._shade_session(worker.devices["kitchen"]) as second:
+        pass
+
+    assert second is first and first.connected
+    worker.stop()
+    assert not first.connected
+    assert not worker._sessions and not worker._session_timers
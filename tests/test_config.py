@@ -0,0 +1,88 @@
+import pytest
+
+import config
+from exceptions import ConfigError
+
+
+def workers_config(**workers):
+    return {"workers": workers}
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [(90, 90), (1.5, 1.5), ("90", 90), ("30s", 30), ("5m", 300), ("1h30m", 5400), ("1d", 86400), ("0.5m", 30)],
+)
+def test_parse_interval(value, seconds):
+    assert config.parse_interval(value, "interval") == seconds
+
+
+@pytest.mark.parametrize("value", [-1, "-5m", True, False, None, "5x", "m", [5]])
+def test_parse_interval_rejects_invalid(value):
+    with pytest.raises(ConfigError):
+        config.parse_interval(value, "interval")
+
+
+def test_normalize_mac():
+    assert config.normalize_mac(" AA-bb-CC-dd-EE-ff ", "device") == "AA:bb:CC:dd:EE:ff"
+    assert config.normalize_mac("aa:bb:cc:dd:ee:ff", "device") == "aa:bb:cc:dd:ee:ff"
+
+
+@pytest.mark.parametrize("value", ["aa:bb:cc:dd:ee", "aa:bb-cc:dd:ee:ff", "gg:bb:cc:dd:ee:ff", 12])
+def test_normalize_mac_rejects_invalid(value):
+    with pytest.raises(ConfigError):
+        config.normalize_mac(value, "device")
+
+
+@pytest.mark.parametrize("value, index", [(0, 0), (1, 1), ("1", 1), ("hci1", 1), (" hci12 ", 12)])
+def test_normalize_adapter(value, index):
+    assert config.normalize_adapter(value, "worker") == index
+
+
+@pytest.mark.parametrize("value", [True, "hcix", "usb0", -1])
+def test_normalize_adapter_rejects_invalid(value):
+    with pytest.raises(ConfigError):
+        config.normalize_adapter(value, "worker")
+
+
+def test_worker_args_are_normalized():
+    manager = config.manager_config(workers_config(
+        am43={"args": {
+            "adapter": 1,
+            "command_timeout": "1m",
+            "devices": {"shade": {"mac": "aa-bb-cc-dd-ee-ff", "iface": "hci0"}},
+        }},
+    ))
+
+    args = manager.workers[0].args
+    assert args["adapter"] == "hci1"
+    assert args["command_timeout"] == 60
+    assert args["devices"]["shade"] == {"mac": "aa:bb:cc:dd:ee:ff", "iface": 0}
+
+
+def test_unknown_worker_type():
+    with pytest.raises(ConfigError, match="Unknown worker 'nosuchworker'"):
+        config.manager_config(workers_config(nosuchworker={}))
+    with pytest.raises(ConfigError, match="Unknown type 'nosuchtype' of worker 'named'"):
+        config.manager_config(workers_config(named={"type": "nosuchtype"}))
+
+
+def test_workers_of_a_type_need_different_topic_prefixes():
+    with pytest.raises(ConfigError, match="need different topic_prefix"):
+        config.manager_config(workers_config(
+            first={"type": "miflora", "args": {"topic_prefix": "plants"}},
+            second={"type": "miflora", "args": {"topic_prefix": "plants"}},
+        ))
+
+    manager = config.manager_config(workers_config(
+        first={"type": "miflora", "args": {"topic_prefix": "kitchen"}},
+        second={"type": "miflora", "args": {"topic_prefix": "garden"}},
+    ))
+    assert [worker.name for worker in manager.workers] == ["first", "second"]
+
+
+def test_unsupported_state_format():
+    with pytest.raises(ConfigError, match="Unsupported state_format 'xml' of worker 'miflora'"):
+        config.manager_config(workers_config(miflora={"args": {"state_format": "xml"}}))
+
+    manager = config.manager_config(workers_config(miflora={"args": {"state_format": "json"}}))
+    assert manager.workers[0].args["state_format"] == "json"
@@ -0,0 +1,37 @@
+import pytest
+
+import encoder
+
+BACKENDS = [
+    pytest.param(encoder._stdlib_dumpb, id="stdlib"),
+    pytest.param(
+        encoder.dumpb,
+        id="orjson",
+        marks=pytest.mark.skipif(encoder.orjson is None, reason="orjson not installed"),
+    ),
+]
+
+
+@pytest.mark.parametrize("dumpb", BACKENDS)
+@pytest.mark.parametrize(
+    "obj, expected",
+    [
+        (float("nan"), b"null"),
+        ({"temperature": float("inf"), "humidity": [float("-inf"), 1.5]}, b'{"temperature":null,"humidity":[null,1.5]}'),
+        ({1: "a", None: "b", False: "c"}, b'{"1":"a","null":"b","false":"c"}'),
+        ({"name": "Küche ☀"}, '{"name":"Küche ☀"}'.encode("utf-8")),
+        ({"name": "line\u2028\x1f\\ \"x\""}, '{"name":"line\u2028\\u001f\\\\ \\"x\\""}'.encode("utf-8")),
+        ([1e16, -1e16, 1.5e300, 1.2345678901234568e20, 5e-324], b"[1e16,-1e16,1.5e300,1.2345678901234568e20,5e-324]"),
+        ([1e15, 1e-4, 1e-5, -1.2345e-5, 1e-6, -0.0], b"[1000000000000000.0,0.0001,0.00001,-0.000012345,1e-6,-0.0]"),
+        ({1e16: "float key", "text": "1e+16"}, b'{"1e16":"float key","text":"1e+16"}'),
+        (2 ** 64, b"18446744073709551616"),
+        ({"count": -(2 ** 70), "value": 1e-7}, b'{"count":-1180591620717411303424,"value":1e-7}'),
+        ({"count": 2 ** 64, "value": float("nan")}, b'{"count":18446744073709551616,"value":null}'),
+    ],
+)
+def test_backends_agree(dumpb, obj, expected):
+    assert dumpb(obj) == expected
+
+
+def test_dumps():
+    assert encoder.dumps({"state": "on", "battery": float("nan")}) == '{"state":"on","battery":null}'
@@ -0,0 +1,44 @@
+import sys
+import threading
+import types
+
+import pytest
+
+from exceptions import DeviceTimeoutError
+from workers.linakdesk import LinakdeskWorker
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    monkeypatch.setitem(sys.modules, "linak_dpg_bt", types.SimpleNamespace(LinakDesk=lambda mac: None))
+    return LinakdeskWorker(0.2, 0, 0, None, mac="00:00:00:00:00:01", topic_prefix="desk")
+
+
+def test_no_second_read_while_timed_out_one_is_pending(worker, monkeypatch):
+    release = threading.Event()
+    reads = []
+
+    def read_height():
+        reads.append(True)
+        release.wait(5)
+        return 72.5
+
+    monkeypatch.setattr(worker, "_read_height", read_height)
+    with pytest.raises(DeviceTimeoutError):
+        worker._read_height_with_timeout()
+    with pytest.raises(DeviceTimeoutError):
+        worker._read_height_with_timeout()
+    assert len(reads) == 1
+
+    release.set()
+    assert worker._read_height_with_timeout() == 72.5
+    assert len(reads) == 2
+
+
+def test_read_errors_are_raised(worker, monkeypatch):
+    def read_height():
+        raise KeyError("height")
+
+    monkeypatch.setattr(worker, "_read_height", read_height)
+    with pytest.raises(KeyError):
+        worker._read_height_with_timeout()
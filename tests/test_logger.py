@@ -0,0 +1,20 @@
+import logging
+
+import logger
+
+
+def test_log_exception_summary_keeps_message(caplog, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(logger.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(logger, "_FAILURES", logger.FailureAggregator(interval=300))
+    _LOGGER = logger.get("test")
+
+    with caplog.at_level(logging.WARNING):
+        for elapsed in (0, 60, 60, 180):
+            now[0] += elapsed
+            logger.log_exception(_LOGGER, "%s", "100% failed", key=("test", "ValueError"))
+
+    assert [record.getMessage() for record in caplog.records] == [
+        "100% failed",
+        "100% failed (2 more in the last 5 minutes)",
+    ]
@@ -0,0 +1,173 @@
+import socket
+import time
+
+import pytest
+
+import mqtt
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_forwarder_starts_with_unreachable_broker(closed_port):
+    forwarder = mqtt.BrokerForwarder({"host": "127.0.0.1", "port": closed_port, "client_id": "test-forwarder"})
+    forwarder.start()
+    try:
+        forwarder.forward([mqtt.MqttMessage(topic="test/state", payload="on")])
+
+        deadline = time.monotonic() + 5
+        while not forwarder._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert forwarder._queue.empty()
+        assert forwarder._thread.is_alive()
+        assert not forwarder.client._connected
+    finally:
+        forwarder.client.mqttc.loop_stop()
+
+
+def test_publish_does_not_wait_for_window_while_disconnected():
+    client = mqtt.MqttClient({"host": "127.0.0.1", "inflight_window": 5, "publish_timeout": 1, "qos": {"state": 1}})
+    messages = [mqtt.MqttMessage(topic="test/{}".format(index), payload="on") for index in range(10)]
+
+    started = time.monotonic()
+    batch = client.publish(messages)
+
+    assert time.monotonic() - started < 0.5
+    assert batch.complete
+    assert not client._inflight
+
+
+def test_disconnect_releases_inflight_window():
+    client = mqtt.MqttClient({"host": "127.0.0.1", "inflight_window": 5, "publish_timeout": 1})
+    batch = mqtt.PublishBatch()
+    for mid, qos in enumerate((0, 1, 2)):
+        batch._add()
+        client._inflight[mid] = (batch, qos)
+    batch._seal()
+
+    client._on_disconnect(client.mqttc, None, 1)
+
+    assert not client._inflight
+    assert batch.complete
+    assert batch.failed == 3
+
+
+def test_spool_only_after_connection_was_lost(tmp_path):
+    client = mqtt.MqttClient({"host": "127.0.0.1", "spool_dir": str(tmp_path)})
+    message = mqtt.MqttMessage(topic="test/state", payload="on")
+
+    # The startup burst is left to paho until the first connection
+    client.publish([message])
+    assert client._spool.pending == 0
+
+    client._connected = client._was_connected = True
+    client._on_disconnect(client.mqttc, None, 1)
+    client.publish([message])
+    assert client._spool.pending == 1
+
+
+def test_registered_topics_are_kept_prefixed():
+    client = mqtt.MqttClient({"host": "127.0.0.1", "topic_prefix": "gw"})
+    client._topics._max_topics = 0
+    client.register_topics(["sensor/kitchen"])
+
+    assert client._format_topic("sensor/kitchen") == "gw/sensor/kitchen"
+    assert client._format_topic("sensor/kitchen") is client._format_topic("sensor/kitchen")
+    assert client._topics._entries == {("sensor/kitchen",): "gw/sensor/kitchen"}
+
+
+def test_long_outage_does_not_fill_inflight_window(monkeypatch):
+    client = mqtt.MqttClient({"host": "127.0.0.1", "inflight_window": 5, "publish_timeout": 1, "qos": 1})
+    mids = iter(range(1, 100000))
+
+    def queued(topic, payload=None, qos=0, retain=False, properties=None):
+        # paho queues QoS 1 and 2 messages while disconnected and reports them as sent
+        info = mqtt.mqtt.MQTTMessageInfo(next(mids))
+        info.rc = mqtt.mqtt.MQTT_ERR_SUCCESS
+        return info
+
+    monkeypatch.setattr(client.mqttc, "publish", queued)
+    client._connected = client._was_connected = True
+    client._on_disconnect(client.mqttc, None, 1)
+
+    started = time.monotonic()
+    for index in range(1000):
+        client.publish([mqtt.MqttMessage(topic="test/{}".format(index % 10), payload=str(index))])
+
+    assert time.monotonic() - started < 1
+    assert not client._inflight
+
+
+def test_fanout_applies_publish_policies_to_all_brokers():
+    primary = mqtt.MqttClient({"host": "127.0.0.1"})
+    forwarder = mqtt.BrokerForwarder({"host": "127.0.0.2"})
+    fanout = mqtt.MqttFanout(primary, [forwarder])
+
+    fanout.add_publish_policy("sensor", enabled=True, heartbeat=60)
+    for client in (primary, forwarder.client):
+        assert client._publish_cache.active
+        assert client._publish_cache.should_publish("sensor/a", "sensor/a", b"1")
+        assert not client._publish_cache.should_publish("sensor/a", "sensor/a", b"1")
+
+    fanout.reset_publish_cache()
+    fanout.remove_publish_policy("sensor")
+    for client in (primary, forwarder.client):
+        assert not client._publish_cache.active
+
+
+def test_publish_cache_suppresses_unchanged_payloads_until_heartbeat(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(mqtt.time, "monotonic", lambda: now[0])
+    cache = mqtt.PublishCache(True, 60, 100)
+
+    assert cache.should_publish("test/state", "test/state", b"on")
+    assert not cache.should_publish("test/state", "test/state", b"on")
+    assert cache.should_publish("test/state", "test/state", b"off")
+
+    now[0] += 59
+    assert not cache.should_publish("test/state", "test/state", b"off")
+    now[0] += 1
+    assert cache.should_publish("test/state", "test/state", b"off")
+    assert (cache.sent, cache.suppressed) == (3, 2)
+
+
+def test_publish_cache_policies():
+    cache = mqtt.PublishCache(False, 60, 100)
+    cache.add_policy("quiet", enabled=True)
+
+    assert cache.active
+    assert cache.should_publish("loud/state", "loud/state", b"on")
+    assert cache.should_publish("loud/state", "loud/state", b"on")
+    assert cache.should_publish("quiet/state", "quiet/state", b"on")
+    assert not cache.should_publish("quiet/state", "quiet/state", b"on")
+
+    cache.clear()
+    assert cache.should_publish("quiet/state", "quiet/state", b"on")
+
+
+def test_discovery_hashes_persist(tmp_path):
+    path = str(tmp_path / "discovery.json")
+    hashes = mqtt.DiscoveryHashes(path)
+    assert hashes.should_publish("homeassistant/sensor/config", b"{}")
+    hashes.save()
+
+    reloaded = mqtt.DiscoveryHashes(path)
+    assert not reloaded.should_publish("homeassistant/sensor/config", b"{}")
+    assert reloaded.should_publish("homeassistant/sensor/config", b'{"name": "changed"}')
+
+
+def test_discovery_hashes_cleared_without_session(tmp_path):
+    path = str(tmp_path / "discovery.json")
+    client = mqtt.MqttClient({"host": "127.0.0.1", "discovery_cache": path})
+    assert client._discovery_hashes.should_publish("homeassistant/sensor/config", b"{}")
+
+    client.on_connect(client.mqttc, None, {"session present": 1}, mqtt.mqtt.CONNACK_ACCEPTED)
+    assert not client._discovery_hashes.should_publish("homeassistant/sensor/config", b"{}")
+
+    client.on_connect(client.mqttc, None, {"session present": 0}, mqtt.mqtt.CONNACK_ACCEPTED)
+    assert client._discovery_hashes.should_publish("homeassistant/sensor/config", b"{}")
+    assert mqtt.DiscoveryHashes(path).should_publish("homeassistant/sensor/config", b"{}")
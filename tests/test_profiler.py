@@ -0,0 +1,59 @@
+import json
+import sys
+import types
+
+import profiler
+import workers_requirements
+
+
+def worker_config(name, worker_type, **args):
+    return types.SimpleNamespace(
+        name=name,
+        type=worker_type,
+        args=args,
+        update_interval=None,
+        command_timeout=10,
+        command_retries=0,
+        update_retries=0,
+        config_timeout=10,
+        topic_subscription=None,
+        publish_on_change=None,
+        publish_heartbeat=None,
+    )
+
+
+def test_failures_are_reported(monkeypatch, tmp_path):
+    settings = {
+        "mqtt": {"topic_prefix": "gw"},
+        "manager": {"workers": {"lights": {"type": "lightstring"}, "broken": {"type": "lightstring"}}},
+    }
+    config = types.SimpleNamespace(
+        command_timeout=10,
+        sensor_config=None,
+        topic_subscription={},
+        workers=(
+            worker_config("lights", "lightstring", devices={"xmas": "00:00:00:00:00:01"}, topic_prefix="lights"),
+            # Fails in _setup without devices
+            worker_config("broken", "lightstring", topic_prefix="broken"),
+        ),
+        state_snapshot=None,
+        state_snapshot_interval=60,
+    )
+    module = types.ModuleType("config")
+    module.settings = settings
+    module.load_settings = lambda: settings
+    module.manager_config = lambda manager: config
+    monkeypatch.setitem(sys.modules, "config", module)
+    monkeypatch.setattr(workers_requirements, "_check_requirement", "{} is missing".format)
+    monkeypatch.setattr(profiler, "_PHASES", [])
+    monkeypatch.setattr(profiler, "_IMPORT_TIMER", profiler.ImportTimer())
+
+    report = profiler.run(devices=2)
+
+    assert report["requirement_errors"] == ["bluepy is missing"]
+    phases = {phase["name"]: phase for phase in report["phases"]}
+    assert "error" not in phases["setup.lights"]
+    assert phases["setup.broken"]["error"].startswith("AttributeError")
+    path = tmp_path / "report.json"
+    profiler.write(report, str(path))
+    assert json.loads(path.read_text())["phases"] == report["phases"]
@@ -0,0 +1,24 @@
+import json
+
+from snapshot import SNAPSHOT_VERSION, StateSnapshot
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "state.json")
+    StateSnapshot(path).save({"blinds": {"position": 40, "name": "Küche west"}})
+
+    with open(path) as f:
+        data = json.load(f)
+    assert data["version"] == SNAPSHOT_VERSION
+    assert data["workers"] == {"blinds": {"position": 40, "name": "Küche west"}}
+
+    snapshot = StateSnapshot(path)
+    assert snapshot.pop("blinds") == {"position": 40, "name": "Küche west"}
+    assert snapshot.pop("blinds") is None
+
+
+def test_unsupported_version_is_ignored(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"version": SNAPSHOT_VERSION + 1, "workers": {"blinds": {}}}))
+
+    assert StateSnapshot(str(path)).pop("blinds") is None
@@ -0,0 +1,117 @@
+import os
+import time
+
+from spool import REPLAY_LATEST, MessageSpool
+
+
+def replayed(spool, *args):
+    messages = []
+    assert spool.replay(lambda topic, payload, qos, retain: messages.append((topic, payload)) or True, *args)
+    return messages
+
+
+def segment_paths(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path))
+
+
+def test_replay_in_order(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("a", b"1", qos=1, retain=True)
+    spool.append("b", b"2")
+
+    sent = []
+    assert spool.replay(lambda *message: sent.append(message) or True)
+    assert sent == [("a", b"1", 1, True), ("b", b"2", 0, False)]
+    assert spool.pending == 0
+    assert replayed(spool) == []
+
+
+def test_replay_resumes_where_send_stopped(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    for index in range(3):
+        spool.append("t", str(index).encode())
+
+    sent = []
+    assert not spool.replay(lambda topic, payload, qos, retain: len(sent) < 1 and sent.append(payload) is None)
+    assert sent == [b"0"]
+    assert spool.pending == 2
+    assert replayed(spool) == [("t", b"1"), ("t", b"2")]
+
+
+def test_replay_latest(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("a", b"1")
+    spool.append("b", b"2")
+    spool.append("a", b"3")
+
+    assert replayed(spool, REPLAY_LATEST) == [("b", b"2"), ("a", b"3")]
+
+
+def test_replay_max_age(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("a", b"old", created=time.time() - 120)
+    spool.append("a", b"new")
+
+    assert replayed(spool, "all", 60) == [("a", b"new")]
+
+
+def test_recover_after_restart(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("a", b"1")
+    spool.append("b", b"2")
+    spool.close()
+
+    spool = MessageSpool(str(tmp_path))
+    assert spool.pending == 2
+    assert replayed(spool) == [("a", b"1"), ("b", b"2")]
+
+
+def test_recover_cuts_torn_tail(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("a", b"1")
+    spool.append("b", b"2")
+    spool.close()
+    path = segment_paths(str(tmp_path))[0]
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 1)
+
+    spool = MessageSpool(str(tmp_path))
+    assert spool.pending == 1
+    assert os.path.getsize(path) == size // 2
+    assert replayed(spool) == [("a", b"1")]
+
+
+def test_recover_stops_at_crc_mismatch(tmp_path):
+    spool = MessageSpool(str(tmp_path))
+    spool.append("a", b"1")
+    spool.append("b", b"2")
+    spool.close()
+    path = segment_paths(str(tmp_path))[0]
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"x")
+
+    spool = MessageSpool(str(tmp_path))
+    assert replayed(spool) == [("a", b"1")]
+
+
+def test_full_spool_drops_oldest_segments(tmp_path):
+    # 43 byte records, two of them fit a segment of a quarter of the spool
+    spool = MessageSpool(str(tmp_path), max_bytes=400)
+    for index in range(20):
+        assert spool.append("t/{}".format(index % 10), b"x" * 20)
+
+    assert spool.size <= 400
+    assert spool.dropped > 0
+    assert spool.pending == 20 - spool.dropped
+    messages = replayed(spool)
+    assert [topic for topic, _ in messages] == ["t/{}".format(index % 10) for index in range(spool.dropped, 20)]
+
+
+def test_message_larger_than_spool_is_dropped(tmp_path):
+    spool = MessageSpool(str(tmp_path), max_bytes=100)
+
+    assert not spool.append("t", b"x" * 200)
+    assert spool.dropped == 1
+    assert spool.pending == 0
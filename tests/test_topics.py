@@ -0,0 +1,27 @@
+from topics import TopicRegistry
+
+
+def test_topics_are_built_once():
+    topics = TopicRegistry("prefix")
+
+    assert topics.topic("kitchen", "temperature") == "prefix/kitchen/temperature"
+    assert topics.topic("kitchen", "temperature") is topics.topic("kitchen", "temperature")
+    assert TopicRegistry().topic("kitchen") == "kitchen"
+
+
+def test_registered_topics_are_kept_past_max_topics():
+    topics = TopicRegistry("prefix", max_topics=1)
+    topics.topic("other")
+
+    registered = topics.register("kitchen", "state")
+    assert topics.topic("kitchen", "state") is registered
+    assert topics.register("kitchen", "state") is registered
+    assert list(topics.registered.values()) == ["prefix/kitchen/state"]
+    assert ("unknown",) not in topics._entries and topics.topic("unknown") == "prefix/unknown"
+
+
+def test_cached_keys_dont_collide_with_topics():
+    topics = TopicRegistry()
+
+    assert topics.cached(("kitchen",), "config/{}".format, "kitchen") == "config/kitchen"
+    assert topics.topic("kitchen") == "kitchen"
@@ -0,0 +1,94 @@
+import sys
+import types
+
+import pytest
+
+from workers_manager import WorkersManager
+from workers_queue import _WORKERS_QUEUE
+
+
+class FakeMqtt:
+    availability_topic = None
+
+    def subscribe(self, topic, callback):
+        pass
+
+    def unsubscribe(self, topic):
+        pass
+
+
+def manager_config(workers=(), topic_subscription=None, command_timeout=35):
+    return types.SimpleNamespace(
+        command_timeout=command_timeout,
+        sensor_config=None,
+        topic_subscription=topic_subscription or {},
+        workers=tuple(workers),
+        state_snapshot=None,
+        state_snapshot_interval=60,
+    )
+
+
+@pytest.fixture
+def reloaded_config(monkeypatch):
+    # config reads config.yaml when imported
+    module = types.ModuleType("config")
+    module.load_settings = lambda: {"manager": None}
+    monkeypatch.setitem(sys.modules, "config", module)
+
+    def reload_to(config):
+        module.manager_config = lambda settings: config
+
+    return reload_to
+
+
+def test_reload_from_mqtt_is_applied_by_main_loop(monkeypatch):
+    manager = WorkersManager(
+        manager_config(topic_subscription={"reload_config": {"topic": "reload", "payload": "reload"}}), FakeMqtt()
+    )
+    reloads = []
+    monkeypatch.setattr(manager, "reload_config", lambda: reloads.append(True))
+
+    manager._on_manager_callback("reload_config", "reload", None, None, types.SimpleNamespace(payload=b"reload"))
+
+    assert _WORKERS_QUEUE.empty()
+    manager.reload_if_requested()
+    manager.reload_if_requested()
+    assert reloads == [True]
+
+
+def test_failed_reload_keeps_previous_config(monkeypatch, reloaded_config):
+    old_worker = types.SimpleNamespace(name="sensor", update_interval=60)
+    old_config = manager_config([old_worker])
+    manager = WorkersManager(old_config, FakeMqtt())
+    registration = manager.Registration(old_worker, object())
+    manager._registrations = {"sensor": registration}
+
+    def fail(registration, worker_config):
+        raise RuntimeError("reload failed")
+
+    monkeypatch.setattr(manager, "_update_worker", fail)
+    reloaded_config(manager_config([types.SimpleNamespace(name="sensor", update_interval=30)], command_timeout=10))
+    manager.reload_config()
+
+    assert manager._config is old_config
+    assert manager._command_timeout == 35
+    assert manager._registrations == {"sensor": registration}
+
+
+def test_daemon_without_stop_is_not_recreated(monkeypatch, reloaded_config):
+    old_worker = types.SimpleNamespace(name="serial", update_interval=None)
+    manager = WorkersManager(manager_config([old_worker]), FakeMqtt())
+    registration = manager.Registration(old_worker, object())
+    registration.daemon = True
+    manager._registrations = {"serial": registration}
+
+    def register(*args):
+        raise AssertionError("recreated a daemon that can't be stopped")
+
+    monkeypatch.setattr(manager, "_update_worker", lambda registration, worker_config: False)
+    monkeypatch.setattr(manager, "_register_worker", register)
+    reloaded_config(manager_config([types.SimpleNamespace(name="serial", update_interval=None, port="/dev/ttyUSB1")]))
+    manager.reload_config()
+
+    assert manager._registrations == {"serial": registration}
+    assert registration.config is old_worker
@@ -0,0 +1,49 @@
+import pytest
+
+import workers_requirements
+
+INSTALLED = {"pyyaml": "6.0.1", "pytest": "7.4.0", "bluepy": "1.3.0", "Zemismart": "0.1.0"}
+
+
+@pytest.fixture(autouse=True)
+def installed(monkeypatch):
+    monkeypatch.setattr(workers_requirements, "_installed_version", INSTALLED.get)
+
+
+@pytest.mark.parametrize(
+    "requirement",
+    [
+        "bluepy",
+        "pyyaml>=5",
+        "pyyaml>=5,<7",
+        "pytest==7.*",
+        "pytest~=7.1",
+        "pyyaml==6.0.1",
+        "git+https://github.com/andrey-yantsen/python-zemismart-roller-shade.git@61a9a38#egg=Zemismart",
+        "Zemismart @ git+https://github.com/andrey-yantsen/python-zemismart-roller-shade.git",
+        "git+https://github.com/andrey-yantsen/python-zemismart-roller-shade.git",
+    ],
+)
+def test_satisfied(requirement):
+    assert workers_requirements._check_requirement(requirement) is None
+
+
+@pytest.mark.parametrize(
+    "requirement, error",
+    [
+        ("pyyaml>=99", "pyyaml 6.0.1 is installed but pyyaml>=99 is required"),
+        ("pytest==8.*", "pytest 7.4.0 is installed but pytest==8.* is required"),
+        ("mithermometer==0.1.4", "The 'mithermometer' distribution was not found and is required by the application"),
+        (
+            "git+https://github.com/zewelor/linak_bt_desk.git@aa9412f#egg=linakdpgbt",
+            "The 'linakdpgbt' distribution was not found and is required by the application",
+        ),
+    ],
+)
+def test_unsatisfied(requirement, error):
+    assert workers_requirements._check_requirement(requirement) == error
+
+
+def test_invalid_requirement():
+    with pytest.raises(ValueError):
+        workers_requirements._check_requirement("pyyaml >= >= 5")
@@ -0,0 +1,53 @@
+import sys
+
+DEFAULT_MAX_TOPICS = 4096
+
+
+class TopicRegistry:
+    """
+    Builds each topic once and serves it by key afterwards, topics of configured devices never change.
+    Those are registered at setup, others are built on first use. Topics built past max_topics
+    (e.g. containing payload data) are returned without being kept.
+    """
+
+    def __init__(self, prefix=None, max_topics=DEFAULT_MAX_TOPICS):
+        self._prefix = prefix
+        self._max_topics = max_topics
+        self._entries = {}
+        # Topics of configured devices built at setup, by parts
+        self.registered = {}
+
+    def topic(self, *parts):
+        try:
+            return self._entries[parts]
+        except KeyError:
+            return self._store(parts, self._build(parts))
+
+    def register(self, *parts):
+        """
+        Build the topic of a configured device up front, it is kept regardless of max_topics
+        """
+        topic = self.registered.get(parts)
+        if topic is None:
+            topic = self._entries.get(parts) or sys.intern(self._build(parts))
+            self._entries[parts] = self.registered[parts] = topic
+        return topic
+
+    def _build(self, parts):
+        if self._prefix is not None:
+            return "/".join([self._prefix, *parts])
+        return "/".join(parts)
+
+    def cached(self, key, build, *args):
+        # None never is a topic part, so these keys can't collide with the ones of topic()
+        key = (None, *key)
+        try:
+            return self._entries[key]
+        except KeyError:
+            return self._store(key, build(*args))
+
+    def _store(self, key, value):
+        if len(self._entries) < self._max_topics:
+            value = sys.intern(value)
+            self._entries[key] = value
+        return value
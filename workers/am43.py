@@ -1,5 +1,6 @@
-import json
+import threading
 import time
+from contextlib import contextmanager
 
 import logger
 from const import DEFAULT_PER_DEVICE_TIMEOUT
@@ -18,16 +19,22 @@ class Am43Worker(BaseWorker):
     per_device_timeout = DEFAULT_PER_DEVICE_TIMEOUT  # type: int
     target_range_scale = 3  # type: int
     last_target_position = 255
+    # Authenticated connections are kept open for follow-up polls and commands until idle for this time,
+    # 0 disconnects after every operation
+    session_idle_timeout = 30  # type: float
+    default_update_interval = None  # type: float
+    rapid_update_interval = None  # type: float
+    # Adapter of devices without their own iface
+    iface = None  # type: int
 
     def _setup(self):
         self._last_position_by_device = {device['mac']: 255 for device in self.devices.values()}
         self._last_device_update = {device['mac']: 0 for device in self.devices.values()}
-
-        if not hasattr(self, 'default_update_interval'):
-            self.default_update_interval = None
-
-        if not hasattr(self, 'rapid_update_interval'):
-            self.rapid_update_interval = None
+        self._sessions = {}
+        self._session_timers = {}
+        # Guards the two dicts above only, a session is used under the lock of its device
+        self._sessions_lock = threading.RLock()
+        self._device_locks = {device['mac']: threading.RLock() for device in self.devices.values()}
 
         self.update_interval = self.default_update_interval
         self.availability_topic = None
@@ -127,6 +134,86 @@ class Am43Worker(BaseWorker):
             retain=settings['manager']["sensor_config"].get("retain", True)
         )
 
+    @contextmanager
+    def _shade_session(self, data):
+        from Zemismart import Zemismart
+
+        mac = data['mac']
+        # A slow or unresponsive blind only holds up its own operations
+        with self._device_lock(mac):
+            with self._sessions_lock:
+                timer = self._session_timers.pop(mac, None)
+                if timer is not None:
+                    timer.cancel()
+                shade = self._sessions.pop(mac, None)
+
+            if shade is None:
+                # Sessions of several blinds may be open at once, so the library-wide mutex can't be held
+                # for their lifetime; the lock of the device serializes access instead
+                shade = Zemismart(mac, data["pin"], max_connect_time=self.per_device_timeout,
+                                  withMutex=not self.session_idle_timeout, iface=data.get('iface', self.iface))
+                shade.__enter__()
+                _LOGGER.debug("Opened session to %s device (%s)", repr(self), mac)
+
+            try:
+                yield shade
+            except BaseException:
+                # The connection state is unknown after a failure, reconnect next time
+                shade.__exit__(None, None, None)
+                raise
+
+            if self.session_idle_timeout:
+                timer = threading.Timer(self.session_idle_timeout, self._close_session)
+                timer.args = [mac, timer]
+                timer.daemon = True
+                with self._sessions_lock:
+                    self._sessions[mac] = shade
+                    self._session_timers[mac] = timer
+                timer.start()
+            else:
+                shade.__exit__(None, None, None)
+
+    def _device_lock(self, mac):
+        with self._sessions_lock:
+            return self._device_locks.setdefault(mac, threading.RLock())
+
+    def _close_session(self, mac, timer=None):
+        with self._device_lock(mac):
+            with self._sessions_lock:
+                if timer is not None and self._session_timers.get(mac) is not timer:
+                    # The session was used again while this timer waited for the lock
+                    return
+                self._session_timers.pop(mac, None)
+                shade = self._sessions.pop(mac, None)
+            if shade is not None:
+                _LOGGER.debug("Closing idle session to %s device (%s)", repr(self), mac)
+                shade.__exit__(None, None, None)
+
+    def snapshot(self):
+        return {
+            "last_position": dict(self._last_position_by_device),
+            "last_update": dict(self._last_device_update),
+            "last_target_position": self.last_target_position,
+        }
+
+    def restore(self, state):
+        for mac in self._last_position_by_device:
+            if mac in state["last_position"]:
+                self._last_position_by_device[mac] = state["last_position"][mac]
+                self._last_device_update[mac] = state["last_update"][mac]
+        self.last_target_position = state["last_target_position"]
+
+    def stop(self):
+        with self._sessions_lock:
+            macs = list(self._sessions)
+            for mac in macs:
+                timer = self._session_timers.pop(mac, None)
+                if timer is not None:
+                    timer.cancel()
+        # The lock of a device is taken before the sessions lock
+        for mac in macs:
+            self._close_session(mac)
+
     # Based on the accessory configuration, this will either
     # return the supplied value right back, or will invert
     # it so 100 is considered open instead of closed
@@ -213,7 +300,7 @@ class Am43Worker(BaseWorker):
         ret = [
             MqttMessage(
                 topic=self.format_topic(device_name),
-                payload=json.dumps(device_state)
+                payload=device_state
             ),
             MqttMessage(
                 topic=self.format_topic(device_name, "currentPosition"),
@@ -256,10 +343,7 @@ class Am43Worker(BaseWorker):
     def single_device_status_update(self, device_name, data):
         _LOGGER.debug("Updating %s device '%s' (%s)", repr(self), device_name, data["mac"])
 
-        from Zemismart import Zemismart
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self._shade_session(data) as shade:
             ret = []
             device_state = self.get_device_state(device_name, data, shade)
             ret += self.create_mqtt_messages(device_name, device_state)
@@ -291,13 +375,9 @@ class Am43Worker(BaseWorker):
             yield retry(self.single_device_status_update, retries=self.update_retries)(device_name, data)
 
     def set_state(self, state, device_name):
-        from Zemismart import Zemismart
-
         ret = []
         data = self.devices[device_name]
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self._shade_session(data) as shade:
             device_state = self.get_device_state(device_name, data, shade)
             device_position = self.correct_value(data, device_state["currentPosition"])
 
@@ -375,8 +455,6 @@ class Am43Worker(BaseWorker):
         return ret
 
     def set_position(self, position, device_name):
-        from Zemismart import Zemismart
-
         ret = []
 
         # internal state of the target position should align with the scale used by the
@@ -388,9 +466,7 @@ class Am43Worker(BaseWorker):
         target_position = self.correct_value(data, int(position))
         self.last_target_position = target_position
 
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self._shade_session(data) as shade:
             # get the current state so we can work out direction for update messages
             # after getting this, convert so we are using the device scale for
             # values
@@ -435,16 +511,12 @@ class Am43Worker(BaseWorker):
         return ret
 
     def set_timer_state(self, timer_id, state, device_name):
-        from Zemismart import Zemismart
-
         ret = []
 
         data = self.devices[device_name]
         target_state = True if state == 'ON' else False
 
-        shade = Zemismart(data["mac"], data["pin"], max_connect_time=self.per_device_timeout,
-                          withMutex=True, iface=data.get('iface'))
-        with shade:
+        with self._shade_session(data) as shade:
             shade.update()
             shade.timer_toggle(timer_id, target_state)
             device_state = self.get_device_state(device_name, data, shade)
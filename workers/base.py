@@ -2,13 +2,23 @@ import logger
 
 import functools
 import logging
+import random
 
 import tenacity
 
+from const import STATE_FORMAT_ATTRIBUTES, STATE_FORMAT_JSON
+from mqtt import MqttMessage
+from topics import TopicRegistry
+
 _LOGGER = logger.get(__name__)
 
 
 class BaseWorker:
+    # Workers with several attributes per device publish one message per attribute, or a single JSON document
+    state_format = STATE_FORMAT_ATTRIBUTES  # type: str
+    # Name of the configured worker, the module name unless several instances of a worker are configured
+    instance_name = None  # type: str
+
     def __init__(self, command_timeout, command_retries, update_retries, global_topic_prefix, **kwargs):
         self.command_timeout = command_timeout
         self.command_retries = command_retries
@@ -16,35 +26,84 @@ class BaseWorker:
         self.global_topic_prefix = global_topic_prefix
         for arg, value in kwargs.items():
             setattr(self, arg, value)
+        self.topics = TopicRegistry(getattr(self, "topic_prefix", None))
         self._setup()
 
     def _setup(self):
         return
 
     def format_discovery_topic(self, mac, *sensor_args):
+        return self.topics.cached(
+            ("discovery_topic", mac, *sensor_args), self._build_discovery_topic, mac, sensor_args
+        )
+
+    def _build_discovery_topic(self, mac, sensor_args):
         node_id = mac.replace(":", "-")
         object_id = "_".join([repr(self), *sensor_args])
         return "{}/{}".format(node_id, object_id)
 
     def format_discovery_id(self, mac, *sensor_args):
-        return "bt-mqtt-gateway/{}".format(
-            self.format_discovery_topic(mac, *sensor_args)
+        return self.topics.cached(
+            ("discovery_id", mac, *sensor_args),
+            "bt-mqtt-gateway/{}".format,
+            self.format_discovery_topic(mac, *sensor_args),
         )
 
     def format_discovery_name(self, *sensor_args):
-        return "_".join([repr(self), *sensor_args])
+        return self.topics.cached(
+            ("discovery_name", *sensor_args), "_".join, [repr(self), *sensor_args]
+        )
 
     def format_topic(self, *topic_args):
-        return "/".join([self.topic_prefix, *topic_args])
+        return self.topics.topic(*topic_args)
+
+    @property
+    def device_topics(self):
+        """
+        Topics registered at setup, the MQTT clients keep them with their global prefix
+        """
+        return list(self.topics.registered.values())
 
     def format_prefixed_topic(self, *topic_args):
+        return self.topics.cached(("prefixed", *topic_args), self._build_prefixed_topic, topic_args)
+
+    def _build_prefixed_topic(self, topic_args):
         topic = self.format_topic(*topic_args)
         if self.global_topic_prefix:
             return "{}/{}".format(self.global_topic_prefix, topic)
         return topic
 
+    def state_messages(self, name, values, subtopics=None):
+        """
+        Messages publishing the state of a device in the configured state_format
+        :param name: device name
+        :param values: attribute values, keyed by attribute name
+        :param subtopics: topics of attributes not published below their own name
+        :return: list of MqttMessage
+        """
+        if self.state_format == STATE_FORMAT_JSON:
+            return [MqttMessage(topic=self.format_topic(name), payload=values)]
+
+        subtopics = subtopics or {}
+        return [
+            MqttMessage(topic=self.format_topic(name, subtopics.get(attr, attr)), payload=value)
+            for attr, value in values.items()
+        ]
+
+    def state_config(self, name, attr, subtopic=None, topic_key="state_topic", template_key="value_template",
+                     template="{{{{ value_json.{} }}}}"):
+        """
+        Discovery config entries pointing Home Assistant at the state of an attribute published by state_messages
+        """
+        if self.state_format == STATE_FORMAT_JSON:
+            return {
+                topic_key: self.format_prefixed_topic(name),
+                template_key: template.format(attr),
+            }
+        return {topic_key: self.format_prefixed_topic(name, subtopic or attr)}
+
     def __repr__(self):
-        return self.__module__.split(".")[-1]
+        return self.instance_name or self.__module__.split(".")[-1]
 
     @staticmethod
     def true_false_to_ha_on_off(true_false):
@@ -61,6 +120,7 @@ class BaseWorker:
             dev_name,
             type(exception).__name__,
             suppress=True,
+            key=(repr(self), dev_name, type(exception).__name__),
         )
 
     def log_timeout_exception(self, named_logger, dev_name):
@@ -70,6 +130,7 @@ class BaseWorker:
             repr(self),
             dev_name,
             suppress=True,
+            key=(repr(self), dev_name, "timeout"),
         )
 
     def log_connect_exception(self, named_logger, dev_name, exception):
@@ -80,6 +141,7 @@ class BaseWorker:
             dev_name,
             type(exception).__name__,
             suppress=True,
+            key=(repr(self), dev_name, type(exception).__name__),
         )
 
     def log_unspecified_exception(self, named_logger, dev_name, exception):
@@ -90,8 +152,31 @@ class BaseWorker:
             dev_name,
             type(exception).__name__,
             suppress=True,
+            key=(repr(self), dev_name, type(exception).__name__),
         )
 
+
+class Backoff:
+    """
+    Exponential delay between reconnection attempts of long-lived device connections.
+    Call reset() once a connection is established, next() to get the delay before the next attempt.
+    """
+    def __init__(self, initial=5, maximum=300, factor=2):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self._delay = initial
+
+    def reset(self):
+        self._delay = self.initial
+
+    def next(self):
+        delay = self._delay
+        self._delay = min(self._delay * self.factor, self.maximum)
+        # Spread reconnects of several devices dropping at once
+        return delay * random.uniform(0.8, 1.2)
+
+
 def retry(_func=None, *, retries=0, exception_type=Exception):
     def log_retry(retry_state):
         _LOGGER.info(
@@ -27,7 +27,7 @@ class BleDeviceStatus:
         self.mac = mac.lower()
         self.name = name
         self.available = available
-        self.last_update = 0
+        self.last_update = last_update
         self.has_config_message = has_config_message
 
     def set_status(self, scanEntry):
@@ -57,48 +57,45 @@ class BleDeviceStatus:
         else:
             return "offline"
 
+    def _hass_config(self, name):
+        return {
+            "dev": {
+                "ids": [self.name],
+                "cns": [["mac", self.mac]],
+                "name": self.name,
+            },
+            "name": name,
+            "~": "{}/{}".format(self.worker.global_topic_prefix, self.worker.format_topic(self.name)),
+            "uniq_id": "{}_{}".format(self.name, name),
+            "qos": 1,
+            "stat_t": "~/{}".format(name),
+        }
+
     def payload_hass_config_online(self):
-        ret =  '{'
-        ret += '"dev":{'
-        ret += '"ids":["{}"],'.format(self.name)
-        ret += '"cns":[["mac","{}"]],'.format(self.mac)
-        ret += '"name":"{}"'.format(self.name)
-        ret += '},'
-        ret += '"name":"online",'
-        ret += '"~":"{}/{}",'.format(self.worker.global_topic_prefix, self.worker.format_topic(self.name))
-        ret += '"uniq_id":"{}_online",'.format(self.name)
-        ret += '"qos":1,'
-        ret += '"stat_t":"~/online",'
-        ret += '"pl_on":"online",'
-        ret += '"pl_off":"offline",'
-        ret += '"dev_cla":"connectivity",'
-        ret += '"avty_t":"{}/LWT",'.format(self.worker.global_topic_prefix)
-        ret += '"source_type":"bluetooth_le"'
-        ret += '}'
+        ret = self._hass_config("online")
+        ret.update({
+            "pl_on": "online",
+            "pl_off": "offline",
+            "dev_cla": "connectivity",
+            "avty_t": "{}/LWT".format(self.worker.global_topic_prefix),
+            "source_type": "bluetooth_le",
+        })
         return ret
 
     def payload_hass_config_rssi(self):
-        ret =  '{'
-        ret += '"dev":{'
-        ret += '"ids":["{}"],'.format(self.name)
-        ret += '"cns":[["mac","{}"]],'.format(self.mac)
-        ret += '"name":"{}"'.format(self.name)
-        ret += '},'
-        ret += '"name":"rssi",'
-        ret += '"~":"{}/{}",'.format(self.worker.global_topic_prefix, self.worker.format_topic(self.name))
-        ret += '"uniq_id":"{}_rssi",'.format(self.name)
-        ret += '"qos":1,'
-        ret += '"stat_t":"~/rssi",'
-        ret += '"unit_of_meas":"dBm",'
-        ret += '"dev_cla":"signal_strength",'
-        ret += '"stat_cla":"measurement",'
-        ret += '"entity_category":"diagnostic",'
-        ret += '"availability_mode":"all",'
-        ret += '"availability":['
-        ret += '{"topic":"~/online"},'
-        ret += '{{"topic":"{}/LWT"}}],'.format(self.worker.global_topic_prefix)
-        ret += '"source_type":"bluetooth_le"'
-        ret += '}'
+        ret = self._hass_config("rssi")
+        ret.update({
+            "unit_of_meas": "dBm",
+            "dev_cla": "signal_strength",
+            "stat_cla": "measurement",
+            "entity_category": "diagnostic",
+            "availability_mode": "all",
+            "availability": [
+                {"topic": "~/online"},
+                {"topic": "{}/LWT".format(self.worker.global_topic_prefix)},
+            ],
+            "source_type": "bluetooth_le",
+        })
         return ret
 
 
@@ -143,6 +140,7 @@ class BlescanmultiWorker(BaseWorker):
     unavailable_timeout = 60  # type: float
     scan_timeout = 10.0  # type: float
     scan_passive = True  # type: str or bool
+    adapter = "hci0"  # type: str
 
     def __init__(self, *args, **kwargs):
         from bluepy.btle import Scanner, DefaultDelegate
@@ -156,17 +154,23 @@ class BlescanmultiWorker(BaseWorker):
                     _LOGGER.debug("Discovered new device: %s rssi: %d", dev.addr, dev.rssi)
 
         super(BlescanmultiWorker, self).__init__(*args, **kwargs)
-        self.scanner = Scanner().withDelegate(ScanDelegate())
+        self.scanner = Scanner(int(self.adapter[len("hci"):])).withDelegate(ScanDelegate())
         self.last_status = [
             BleDeviceStatus(self, mac, name) for name, mac in self.devices.items()
         ]
         _LOGGER.info("Adding %d %s devices", len(self.devices), repr(self))
 
-    def format_topic(self, *topic_args):
-        if hasattr(self, 'topic_prefix'):
-            return "/".join([self.topic_prefix, *topic_args])
-        else:
-            return "/".join([*topic_args])
+    def snapshot(self):
+        return {
+            status.mac: [status.available, status.last_update, status.has_config_message]
+            for status in self.last_status
+        }
+
+    def restore(self, state):
+        # Devices seen recently aren't reported offline and their configs not sent again
+        for status in self.last_status:
+            if status.mac in state:
+                status.available, status.last_update, status.has_config_message = state[status.mac]
 
     def status_update(self):
         from bluepy import btle
@@ -189,10 +193,11 @@ class BlescanmultiWorker(BaseWorker):
         except btle.BTLEException as e:
             logger.log_exception(
                 _LOGGER,
-                "Error during update (%s)",
+                "Error during update of %s: %s",
                 repr(self),
                 type(e).__name__,
                 suppress=True,
+                key=(repr(self), None, type(e).__name__),
             )
         finally:            
             self.scanner.clear()
@@ -3,13 +3,16 @@ worker for inkbird ibbq and other equivalent cooking/BBQ thermometers.
 
 Thermometer sends every ~2sec the current temperature.
 
+Every configured thermometer is kept connected by its own thread, the
+latest readings are published every publish_interval seconds.
 """
 import struct
+import threading
+import time
 
 from mqtt import MqttMessage
-from workers.base import BaseWorker
+from workers.base import BaseWorker, Backoff
 import logger
-import json
 
 _LOGGER = logger.get(__name__)
 
@@ -17,39 +20,90 @@ REQUIREMENTS = ["bluepy"]
 
 
 class IbbqWorker(BaseWorker):
+    publish_interval = 5  # type: float
+    battery_interval = 60  # type: float
+    reconnect_delay = 5  # type: float
+    max_reconnect_delay = 120  # type: float
+
     def _setup(self):
         _LOGGER.info("Adding %d %s devices", len(self.devices), repr(self))
+        self._stop_event = threading.Event()
         for name, mac in self.devices.items():
             _LOGGER.info("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = ibbqThermometer(mac, timeout=self.command_timeout)
+            self.topics.register(name)
 
     def format_static_topic(self, *args):
-        return "/".join([self.topic_prefix, *args])
-
-    def __repr__(self):
-        return self.__module__.split(".")[-1]
-
-    def status_update(self):
-        for name, ibbq in self.devices.items():
-            ret = dict()
-            value = list()
-            if not ibbq.connected:
-                ibbq.device = ibbq.connect()
-                ibbq.subscribe()
-                bat, value = None, value
-            else:
-                bat, value = ibbq.update()
-            n = 0
-            ret["available"] = ibbq.connected
-            ret["battery_level"] = bat
-            for i in value:
-                n += 1
-                ret["Temp{}".format(n)] = i
-            return [
-                MqttMessage(
-                    topic=self.format_static_topic(name), payload=json.dumps(ret)
-                )
-            ]
+        return self.format_topic(*args)
+
+    def run(self, mqtt):
+        threads = [
+            threading.Thread(
+                target=self._device_loop,
+                args=(mqtt, name, ibbq),
+                name="{}-{}".format(repr(self), name),
+                daemon=True,
+            )
+            for name, ibbq in self.devices.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _publish(self, mqtt, name, ibbq):
+        ret = dict()
+        ret["available"] = ibbq.connected
+        ret["battery_level"] = ibbq.batteryPct if ibbq.connected else None
+        for n, value in enumerate(ibbq.values if ibbq.connected else [], start=1):
+            ret["Temp{}".format(n)] = value
+        mqtt.publish(
+            [MqttMessage(topic=self.format_static_topic(name), payload=ret)]
+        )
+
+    def _device_loop(self, mqtt, name, ibbq):
+        from bluepy import btle
+
+        backoff = Backoff(self.reconnect_delay, self.max_reconnect_delay)
+
+        while not self._stop_event.is_set():
+            try:
+                ibbq.connect()
+                backoff.reset()
+                published_at = battery_at = time.time()
+
+                while not self._stop_event.is_set():
+                    now = time.time()
+                    if now - battery_at >= self.battery_interval:
+                        ibbq.getBattery()
+                        battery_at = now
+
+                    if ibbq.device.waitForNotifications(1):
+                        ibbq.last_notification = time.time()
+                    elif time.time() - ibbq.last_notification > ibbq.timeout:
+                        _LOGGER.debug("%s is silent, reconnecting", ibbq.mac)
+                        break
+
+                    if time.time() - published_at >= self.publish_interval:
+                        self._publish(mqtt, name, ibbq)
+                        published_at = time.time()
+            except btle.BTLEDisconnectError as e:
+                self.log_connect_exception(_LOGGER, name, e)
+            except btle.BTLEException as e:
+                self.log_unspecified_exception(_LOGGER, name, e)
+            except Exception as e:
+                # Anything else must not end the connection loop of the device either
+                self.log_update_exception(_LOGGER, name, e)
+            finally:
+                was_connected = ibbq.connected
+                ibbq.disconnect()
+                if was_connected:
+                    self._publish(mqtt, name, ibbq)
+
+            self._stop_event.wait(backoff.next())
 
 
 class ibbqThermometer:
@@ -79,131 +133,90 @@ class ibbqThermometer:
             0x00,
         ]
     )
-
-    def getBattery(self):
-        self.Setting_uuid.write(self.batteryLevel)
-
-    def connect(self, timeout=5):
-        from bluepy import btle
-
-        try:
-            device = btle.Peripheral(self.mac)
-            _LOGGER.debug("%s connected ", self.mac)
-            return device
-        except btle.BTLEDisconnectError as er:
-            _LOGGER.debug("failed connect %s", er)
+    # Handle of the setting result characteristic, carrying the battery level
+    SettingResultHandle = 37
+    batMin = 0.95
+    batMax = 1.5
 
     def __init__(self, mac, timeout=5):
-        self.cnt = 0
         self.batteryPct = 0
         self.timeout = timeout
         self.mac = mac
         self.values = list()
-        self.device = self.connect()
-        self.offline = 0
-        if not self.device:
-            return
-        self.device = self.subscribe()
+        self.device = None
+        self.last_notification = 0
 
     @property
     def connected(self):
         return bool(self.device)
 
-    def subscribe(self, timeout=5):
-        from bluepy import btle
+    def getBattery(self):
+        self.Setting_uuid.write(self.batteryLevel)
 
-        class MyDelegate(btle.DefaultDelegate):
-            def __init__(self, caller):
-                btle.DefaultDelegate.__init__(self)
-                self.caller = caller
-                _LOGGER.debug("init mydelegate")
-
-            def handleNotification(self, cHandle, data):
-                batMin = 0.95
-                batMax = 1.5
-                result = list()
-                #    safe = data
-                if cHandle == 37:
-                    if data[0] == 0x24:
-                        currentV = struct.unpack("<H", data[1:3])
-                        maxV = struct.unpack("<H", data[3:5])
-                        self.caller.batteryPct = int(
-                            100
-                            * ((batMax * currentV[0] / maxV[0] - batMin) / (batMax - batMin))
-                        )
-                else:
-                    while len(data) > 0:
-                        v, data = data[0:2], data[2:]
-                        result.append(struct.unpack("<H", v)[0] / 10)
-                    self.caller.values = result
-
-        #    _LOGGER.debug("called handler %s %s", cHandle, safe)
+    def connect(self):
+        from bluepy import btle
 
-        if self.device is None:
-            return
+        self.device = btle.Peripheral(self.mac)
+        _LOGGER.debug("%s connected ", self.mac)
         try:
-            services = self.device.getServices()
-            for service in services:
-                if "fff0" not in str(service.uuid):
-                    continue
-                for schar in service.getCharacteristics():
-                    if self.AccountAndVerify in str(schar.uuid):
-                        self.account_uuid = schar
-                    if self.RealTimeData in str(schar.uuid):
-                        self.RT_uuid = schar
-                    if self.SettingData in str(schar.uuid):
-                        self.Setting_uuid = schar
-                    if self.SettingResult in str(schar.uuid):
-                        self.SettingResult_uuid = schar
-
-            self.account_uuid.write(self.KEY)
-            _LOGGER.info("Authenticated %s", self.mac)
-            self.RT_uuid.getDescriptors()
-            self.device.writeCharacteristic(self.RT_uuid.getHandle() + 1, self.Notify)
-            self.device.writeCharacteristic(
-                self.SettingResult_uuid.getHandle() + 1, self.Notify
-            )
-            self.getBattery()
-            self.Setting_uuid.write(self.realTimeDataEnable)
-            self.device.withDelegate(MyDelegate(self))
-            _LOGGER.info("Subscribed %s", self.mac)
-            self.offline = 0
-        except btle.BTLEException as ex:
-            _LOGGER.info("failed %s %s", self.mac, ex)
-            self.device = None
-            _LOGGER.info("unsubscribe")
+            self.subscribe()
+        except btle.BTLEException:
+            self.disconnect()
+            raise
+        self.last_notification = time.time()
         return self.device
 
-    def update(self):
+    def disconnect(self):
         from bluepy import btle
 
-        if not self.connected:
-            return list()
-        self.values = list()
-        self.cnt += 1
+        if self.device is None:
+            return
         try:
-            if self.cnt > 5:
-                self.cnt = 0
-                self.getBattery()
-            while self.device.waitForNotifications(1):
-                pass
-            if self.values:
-                self.offline = 0
-            else:
-                _LOGGER.debug("%s is silent", self.mac)
-                if self.offline > 3:
-                    try:
-                        self.device.disconnect()
-                    except btle.BTLEInternalError as e:
-                        _LOGGER.debug("%s", e)
-                    self.device = None
-                    _LOGGER.debug("%s reconnect", self.mac)
-                else:
-                    self.offline += 1
-        except btle.BTLEDisconnectError as e:
+            self.device.disconnect()
+        except btle.BTLEException as e:
             _LOGGER.debug("%s", e)
-            self.device = None
         finally:
-            return (self.batteryPct, self.values)
-
-
+            self.device = None
+            self.values = list()
+
+    def subscribe(self):
+        services = self.device.getServices()
+        for service in services:
+            if "fff0" not in str(service.uuid):
+                continue
+            for schar in service.getCharacteristics():
+                if self.AccountAndVerify in str(schar.uuid):
+                    self.account_uuid = schar
+                if self.RealTimeData in str(schar.uuid):
+                    self.RT_uuid = schar
+                if self.SettingData in str(schar.uuid):
+                    self.Setting_uuid = schar
+                if self.SettingResult in str(schar.uuid):
+                    self.SettingResult_uuid = schar
+
+        self.account_uuid.write(self.KEY)
+        _LOGGER.info("Authenticated %s", self.mac)
+        self.RT_uuid.getDescriptors()
+        self.device.writeCharacteristic(self.RT_uuid.getHandle() + 1, self.Notify)
+        self.device.writeCharacteristic(
+            self.SettingResult_uuid.getHandle() + 1, self.Notify
+        )
+        self.device.withDelegate(self)
+        self.getBattery()
+        self.Setting_uuid.write(self.realTimeDataEnable)
+        _LOGGER.info("Subscribed %s", self.mac)
+
+    def handleNotification(self, cHandle, data):
+        if cHandle == self.SettingResultHandle:
+            if data[0] == 0x24:
+                currentV, maxV = struct.unpack("<HH", data[1:5])
+                self.batteryPct = int(
+                    100
+                    * ((self.batMax * currentV / maxV - self.batMin) / (self.batMax - self.batMin))
+                )
+        else:
+            # One little-endian unsigned short per probe, in tenths of a degree
+            self.values = [
+                value / 10
+                for (value,) in struct.iter_unpack("<H", data[: len(data) & ~1])
+            ]
@@ -32,12 +32,14 @@ class LightstringWorker(BaseWorker):
         for name, mac in self.devices.items():
             _LOGGER.info("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = {"lightstring": None, "state": STATE_OFF, "conf": 0, "mac": mac}
+            self.topics.register(name, "state")
+            self.topics.register(name, "conf")
 
     def format_state_topic(self, *args):
-        return "/".join([self.topic_prefix, *args, "state"])
+        return self.format_topic(*args, "state")
 
     def format_conf_topic(self, *args):
-        return "/".join([self.topic_prefix, *args, "conf"])
+        return self.format_topic(*args, "conf")
 
     def status_update(self):
         from bluepy import btle
@@ -99,6 +101,7 @@ class LightstringWorker(BaseWorker):
                     lightstring["mac"],
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), name, type(e).__name__),
                 )
         return ret
 
@@ -160,6 +163,7 @@ class LightstringWorker(BaseWorker):
                 lightstring["mac"],
                 type(e).__name__,
                 suppress=True,
+                key=(repr(self), device_name, type(e).__name__),
             )
             return []
 
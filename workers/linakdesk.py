@@ -1,9 +1,13 @@
+import struct
+import threading
+import time
+
 from interruptingcow import timeout
 
 import logger
 from exceptions import DeviceTimeoutError
 from mqtt import MqttMessage
-from workers.base import BaseWorker
+from workers.base import BaseWorker, Backoff
 
 _LOGGER = logger.get(__name__)
 
@@ -15,11 +19,25 @@ REQUIREMENTS = [
 class LinakdeskWorker(BaseWorker):
 
     SCAN_TIMEOUT = 20
+    # Reference output characteristic, notifies position (0.1 mm) and speed while the desk moves
+    HEIGHT_UUID = "99fa0021-338a-1024-8a49-009c0215f78a"
+
+    # Keep the desk connected and publish height changes as they are notified
+    persistent = False  # type: bool
+    # Minimal time between two height updates published while the desk moves
+    min_publish_interval = 1  # type: float
+    addr_type = "random"  # type: str
+    reconnect_delay = 5  # type: float
+    max_reconnect_delay = 300  # type: float
 
     def _setup(self):
         from linak_dpg_bt import LinakDesk
 
         self.desk = LinakDesk(self.mac)
+        self._stop_event = threading.Event()
+        self._position = None
+        # Height read of run() that may still hold a connection to the desk
+        self._reader = None
 
     def status_update(self):
         return [
@@ -40,8 +58,7 @@ class LinakdeskWorker(BaseWorker):
             ),
         ):
             try:
-                self.desk.read_dpg_data()
-                return self.desk.current_height_with_offset.cm
+                return self._read_height()
             except btle.BTLEException as e:
                 logger.log_exception(
                     _LOGGER,
@@ -50,5 +67,109 @@ class LinakdeskWorker(BaseWorker):
                     self.mac,
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), self.mac, type(e).__name__),
                 )
                 raise DeviceTimeoutError
+
+    def _read_height(self):
+        self.desk.read_dpg_data()
+        return self.desk.current_height_with_offset.cm
+
+    def _read_height_with_timeout(self):
+        # interruptingcow only works in the main thread, run() reads in a thread of its own instead.
+        # A read that timed out can't be cancelled, no second connection is opened until it is done
+        if self._reader is not None:
+            self._reader.join(self.command_timeout)
+            if self._reader.is_alive():
+                raise DeviceTimeoutError(
+                    "Previous height read from {} device {} still hasn't finished".format(repr(self), self.mac)
+                )
+            self._reader = None
+
+        result = {}
+
+        def read():
+            try:
+                result["height"] = self._read_height()
+            except Exception as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=read, name="linakdesk-read", daemon=True)
+        thread.start()
+        thread.join(self.command_timeout)
+        if thread.is_alive():
+            self._reader = thread
+            raise DeviceTimeoutError(
+                "Retrieving the height from {} device {} timed out after {} seconds".format(
+                    repr(self), self.mac, self.command_timeout
+                )
+            )
+        if "error" in result:
+            raise result["error"]
+        return result["height"]
+
+    def run(self, mqtt):
+        from bluepy import btle
+
+        backoff = Backoff(self.reconnect_delay, self.max_reconnect_delay)
+
+        while not self._stop_event.is_set():
+            device = None
+            try:
+                # The desk offset is only known to the DPG, read it with the library once per connection
+                height = self._read_height_with_timeout()
+                mqtt.publish([MqttMessage(topic=self.format_topic("height/cm"), payload=height)])
+
+                device = btle.Peripheral(self.mac, self.addr_type)
+                characteristic = device.getCharacteristics(uuid=self.HEIGHT_UUID)[0]
+                self._position = self._decode_position(characteristic.read())
+                offset = height - self._position
+                device.withDelegate(self)
+                cccd = characteristic.getDescriptors(forUUID=0x2902)[0]
+                cccd.write(b"\x01\x00", withResponse=True)
+                _LOGGER.info("Subscribed to height of %s device (%s)", repr(self), self.mac)
+                backoff.reset()
+
+                self._publish_changes(mqtt, device, offset, height)
+            except btle.BTLEException as e:
+                self.log_connect_exception(_LOGGER, self.mac, e)
+            except DeviceTimeoutError:
+                self.log_timeout_exception(_LOGGER, self.mac)
+            except Exception as e:
+                # Anything else must not end the subscription of the desk either
+                self.log_update_exception(_LOGGER, self.mac, e)
+            finally:
+                if device is not None:
+                    try:
+                        device.disconnect()
+                    except btle.BTLEException:
+                        pass
+
+            self._stop_event.wait(backoff.next())
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _publish_changes(self, mqtt, device, offset, published_height):
+        published_at = 0
+
+        while not self._stop_event.is_set():
+            # Nothing is notified while the desk stands still, so there is nothing to publish either
+            moving = device.waitForNotifications(self.min_publish_interval)
+            height = round(self._position + offset, 1)
+            if height == published_height:
+                continue
+            if moving and time.time() - published_at < self.min_publish_interval:
+                continue
+
+            mqtt.publish([MqttMessage(topic=self.format_topic("height/cm"), payload=height)])
+            published_height = height
+            published_at = time.time()
+
+    @staticmethod
+    def _decode_position(data):
+        position, _speed = struct.unpack("<Hh", data[:4])
+        return position / 100
+
+    def handleNotification(self, handle, data):
+        self._position = self._decode_position(data)
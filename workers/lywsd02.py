@@ -1,11 +1,12 @@
-import json
+import threading
+import time
 import logger
 
 from contextlib import contextmanager
 from struct import unpack
 
 from mqtt import MqttMessage
-from workers.base import BaseWorker
+from workers.base import BaseWorker, Backoff
 
 _LOGGER = logger.get(__name__)
 
@@ -13,8 +14,23 @@ REQUIREMENTS = ["bluepy"]
 
 
 class Lywsd02Worker(BaseWorker):
+    # Keep devices connected and publish readings as they are notified
+    persistent = False  # type: bool
+    # Maximum number of devices connected at once in persistent mode, 0 means no limit
+    max_connections = 0  # type: int
+    # When devices wait for a free connection, a connected one gives its slot up after this time
+    session_time = 300  # type: float
+    battery_interval = 3600  # type: float
+    reconnect_delay = 5  # type: float
+    max_reconnect_delay = 300  # type: float
+
     def _setup(self):
         _LOGGER.info("Adding %d %s devices", len(self.devices), repr(self))
+        self._stop_event = threading.Event()
+        self._slots = threading.Semaphore(self.max_connections) if self.max_connections else None
+        self._waiting_for_slot = 0
+        self._waiting_lock = threading.Lock()
+
         for name, mac in self.devices.items():
             _LOGGER.info("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = Lywsd02(mac, timeout=self.command_timeout)
@@ -30,7 +46,100 @@ class Lywsd02Worker(BaseWorker):
             except btle.BTLEException as e:
                 self.log_unspecified_exception(_LOGGER, name, e)
             else:
-                yield [MqttMessage(topic=self.format_topic(name), payload=json.dumps(ret))]
+                yield [MqttMessage(topic=self.format_topic(name), payload=ret)]
+
+    def run(self, mqtt):
+        threads = [
+            threading.Thread(
+                target=self._subscription_loop,
+                args=(mqtt, name, device),
+                name="{}-{}".format(repr(self), name),
+                daemon=True,
+            )
+            for name, device in self.devices.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        self._stop_event.set()
+
+    @contextmanager
+    def _connection_slot(self):
+        if self._slots is None:
+            yield True
+            return
+
+        with self._waiting_lock:
+            self._waiting_for_slot += 1
+        try:
+            acquired = False
+            while not acquired and not self._stop_event.is_set():
+                acquired = self._slots.acquire(timeout=1)
+        finally:
+            with self._waiting_lock:
+                self._waiting_for_slot -= 1
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._slots.release()
+
+    def _should_yield_slot(self, connected_since):
+        return (
+            self._slots is not None
+            and self._waiting_for_slot > 0
+            and time.time() - connected_since > self.session_time
+        )
+
+    def _subscription_loop(self, mqtt, name, device):
+        from bluepy import btle
+
+        backoff = Backoff(self.reconnect_delay, self.max_reconnect_delay)
+        last_reading = None
+
+        while not self._stop_event.is_set():
+            with self._connection_slot() as acquired:
+                if not acquired:
+                    break
+
+                try:
+                    device.connect()
+                    device.subscribe()
+                    _LOGGER.info("Subscribed to %s device '%s' (%s)", repr(self), name, device.mac)
+                    backoff.reset()
+                    connected_since = time.time()
+
+                    while not self._stop_event.is_set():
+                        if time.time() - device.battery_time > self.battery_interval:
+                            device.readBattery()
+
+                        if not device.waitForNotifications(self.command_timeout):
+                            _LOGGER.debug("%s - silent, reconnecting", device.mac)
+                            break
+
+                        reading = device.values()
+                        if reading != last_reading:
+                            last_reading = reading
+                            mqtt.publish([MqttMessage(topic=self.format_topic(name), payload=reading)])
+
+                        if self._should_yield_slot(connected_since):
+                            _LOGGER.debug("%s - releasing connection for waiting devices", device.mac)
+                            break
+                except btle.BTLEDisconnectError as e:
+                    self.log_connect_exception(_LOGGER, name, e)
+                except btle.BTLEException as e:
+                    self.log_unspecified_exception(_LOGGER, name, e)
+                except Exception as e:
+                    # Anything else must not end the subscription of the device either
+                    self.log_update_exception(_LOGGER, name, e)
+                finally:
+                    device.disconnect()
+
+            self._stop_event.wait(backoff.next())
 
 
 class Lywsd02:
@@ -44,47 +153,82 @@ class Lywsd02:
         self._temperature = None
         self._humidity = None
         self._battery = None
+        self.battery_time = 0
 
-    @contextmanager
-    def connected(self):
+        self._device = None
+        # Characteristic handles don't change between connections, look them up once
+        self._data_cccd_handle = None
+        self._battery_handle = None
+
+    def connect(self):
         from bluepy import btle
 
+        self._device = btle.Peripheral()
+        self._device.connect(self.mac)
+        self._device.setDelegate(self)
         _LOGGER.debug("%s connected ", self.mac)
-        device = btle.Peripheral()
-        device.connect(self.mac)
-        yield device
-        device.disconnect()
+
+        if self._data_cccd_handle is None:
+            c = self._device.getCharacteristics(uuid=self.UUID_DATA)[0]
+            self._data_cccd_handle = c.getDescriptors(forUUID=0x2902)[0].handle
+            self._battery_handle = self._device.getCharacteristics(uuid=self.UUID_BATT)[0].getHandle()
+
+        return self._device
+
+    def disconnect(self):
+        from bluepy import btle
+
+        if self._device is None:
+            return
+        try:
+            self._device.disconnect()
+        except btle.BTLEException as e:
+            _LOGGER.debug("%s failed to disconnect: %s", self.mac, e)
+        finally:
+            self._device = None
+
+    @contextmanager
+    def connected(self):
+        try:
+            yield self.connect()
+        finally:
+            self.disconnect()
 
     def readAll(self):
-        with self.connected() as device:
-            temperature, humidity = self.getData(device)
-            battery = self.getBattery(device)
+        with self.connected():
+            temperature, humidity = self.getData()
+            battery = self.readBattery()
 
             _LOGGER.debug("successfully read %f, %d, %d", temperature, humidity, battery)
 
-            return {
-                "temperature": temperature,
-                "humidity": humidity,
-                "battery": battery,
-            }
+            return self.values()
+
+    def values(self):
+        return {
+            "temperature": self._temperature,
+            "humidity": self._humidity,
+            "battery": self._battery,
+        }
 
-    def getData(self, device):
-        self.subscribe(device, self.UUID_DATA)
+    def getData(self):
+        self.subscribe()
         while True:
-            if device.waitForNotifications(self.timeout):
+            if self.waitForNotifications(self.timeout):
                 break
         return self._temperature, self._humidity
 
-    def getBattery(self, device):
-        c = device.getCharacteristics(uuid=self.UUID_BATT)[0]
-        return ord(c.read())
+    def readBattery(self):
+        self._battery = ord(self._device.readCharacteristic(self._battery_handle))
+        self.battery_time = time.time()
+        return self._battery
 
-    def subscribe(self, device, uuid):
-        device.setDelegate(self)
-        c = device.getCharacteristics(uuid=uuid)[0]
-        d = c.getDescriptors(forUUID=0x2902)[0]
+    def waitForNotifications(self, timeout):
+        return self._device.waitForNotifications(timeout)
 
-        d.write(0x01.to_bytes(2, byteorder="little"), withResponse=True)
+    def subscribe(self):
+        self._device.writeCharacteristic(
+            self._data_cccd_handle, 0x01.to_bytes(2, byteorder="little"), withResponse=True
+        )
 
     def processSensorsData(self, data):
         self._temperature = unpack("H", data[:2])[0] / 100
@@ -1,19 +1,31 @@
-import json
+import threading
 import logger
 
 from contextlib import contextmanager
 
 from mqtt import MqttMessage
-from workers.base import BaseWorker
+from workers.base import BaseWorker, Backoff
 
 _LOGGER = logger.get(__name__)
 
 REQUIREMENTS = ["bluepy"]
 
 class Lywsd03MmcWorker(BaseWorker):
+    passive = False  # type: bool
+    scan_timeout = 20.0  # type: float
+    # Keep active devices connected and publish readings as they are notified
+    persistent = False  # type: bool
+    reconnect_delay = 5  # type: float
+    max_reconnect_delay = 300  # type: float
+
     def _setup(self):
         _LOGGER.info("Adding %d %s devices", len(self.devices), repr(self))
 
+        if self.persistent and self.passive:
+            _LOGGER.warning("Persistent mode of %s is ignored for passive devices", repr(self))
+            self.persistent = False
+
+        self._stop_event = threading.Event()
         for name, mac in self.devices.items():
             _LOGGER.info("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = lywsd03mmc(mac, command_timeout=self.command_timeout, passive=self.passive)
@@ -29,7 +41,7 @@ class Lywsd03MmcWorker(BaseWorker):
 
         if self.passive:
             scanner = btle.Scanner()
-            results = scanner.scan(self.scan_timeout if hasattr(self, 'scan_timeout') else 20.0, passive=True)
+            results = scanner.scan(self.scan_timeout, passive=True)
 
             for res in results:
                 device = self.find_device(res.addr)
@@ -47,7 +59,58 @@ class Lywsd03MmcWorker(BaseWorker):
             except btle.BTLEException as e:
                 self.log_unspecified_exception(_LOGGER, name, e)
             else:
-                yield [MqttMessage(topic=self.format_topic(name), payload=json.dumps(ret))]
+                yield [MqttMessage(topic=self.format_topic(name), payload=ret)]
+
+    def run(self, mqtt):
+        threads = [
+            threading.Thread(
+                target=self._subscription_loop,
+                args=(mqtt, name, device),
+                name="{}-{}".format(repr(self), name),
+                daemon=True,
+            )
+            for name, device in self.devices.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _subscription_loop(self, mqtt, name, device):
+        from bluepy import btle
+
+        backoff = Backoff(self.reconnect_delay, self.max_reconnect_delay)
+        last_reading = None
+
+        while not self._stop_event.is_set():
+            try:
+                device.connect()
+                _LOGGER.info("Subscribed to %s device '%s' (%s)", repr(self), name, device.mac)
+                backoff.reset()
+
+                while not self._stop_event.is_set():
+                    if not device.waitForNotifications(self.command_timeout):
+                        _LOGGER.debug("%s - silent for %d seconds, reconnecting", device.mac, self.command_timeout)
+                        break
+
+                    reading = device.readAll()
+                    if reading != last_reading:
+                        last_reading = reading
+                        mqtt.publish([MqttMessage(topic=self.format_topic(name), payload=reading)])
+            except btle.BTLEDisconnectError as e:
+                self.log_connect_exception(_LOGGER, name, e)
+            except btle.BTLEException as e:
+                self.log_unspecified_exception(_LOGGER, name, e)
+            except Exception as e:
+                # Anything else must not end the subscription of the device either
+                self.log_update_exception(_LOGGER, name, e)
+            finally:
+                device.disconnect()
+
+            self._stop_event.wait(backoff.next())
 
 
 class lywsd03mmc:
@@ -59,20 +122,44 @@ class lywsd03mmc:
         self._temperature = None
         self._humidity = None
         self._battery = None
+        self._device = None
 
-    @contextmanager
-    def connected(self):
+    def connect(self):
         from bluepy import btle
 
+        self._device = btle.Peripheral()
+        self._device.connect(self.mac)
         _LOGGER.debug("%s - connected ", self.mac)
-        device = btle.Peripheral()
-        device.connect(self.mac)
-        device.writeCharacteristic(0x0038, b'\x01\x00', True)
-        device.writeCharacteristic(0x0046, b'\xf4\x01\x00', True)
-        yield device
+        self._device.writeCharacteristic(0x0038, b'\x01\x00', True)
+        self._device.writeCharacteristic(0x0046, b'\xf4\x01\x00', True)
+        self.subscribe(self._device)
+        return self._device
+
+    def disconnect(self):
+        from bluepy import btle
+
+        if self._device is None:
+            return
+        try:
+            self._device.disconnect()
+        except btle.BTLEException as e:
+            _LOGGER.debug("%s - failed to disconnect: %s", self.mac, e)
+        finally:
+            self._device = None
+            _LOGGER.debug("%s - disconnected ", self.mac)
+
+    def waitForNotifications(self, timeout):
+        return self._device.waitForNotifications(timeout)
+
+    @contextmanager
+    def connected(self):
+        try:
+            yield self.connect()
+        finally:
+            self.disconnect()
 
     def readAll(self):
-        if self.passive:
+        if self.passive or self._device is not None:
             temperature = self.getTemperature()
             humidity = self.getHumidity()
             battery = self.getBattery()
@@ -23,6 +23,9 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
     MQTT for Home Assistant. It also creates a binary sensor for
     low batteries. It supports connection retries.
     """
+    passive = False  # type: bool
+    scan_timeout = 20.0  # type: float
+
     def _setup(self):
         _LOGGER.info("Adding %d %s devices", len(self.devices), repr(self))
         for name, mac in self.devices.items():
@@ -97,7 +100,7 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
 
         if self.passive:
             scanner = btle.Scanner()
-            results = scanner.scan(self.scan_timeout if hasattr(self, 'scan_timeout') else 20.0, passive=True)
+            results = scanner.scan(self.scan_timeout, passive=True)
 
             for res in results:
                 device = self.find_device(res.addr)
@@ -123,6 +126,7 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
                     device.mac,
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), name, type(e).__name__),
                 )
             except TypeError:
                 logger.log_exception(
@@ -132,6 +136,7 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
                     name,
                     device.mac,
                     suppress=True,
+                    key=(repr(self), name, "data"),
                 )
             except DeviceTimeoutError:
                 logger.log_exception(
@@ -141,6 +146,7 @@ class Lywsd03Mmc_HomeassistantWorker(BaseWorker):
                     name,
                     device.mac,
                     suppress=True,
+                    key=(repr(self), name, "timeout"),
                 )
 
     def update_device_state(self, name, device):
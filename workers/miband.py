@@ -60,30 +60,34 @@ class MibandDeviceStatus:
             return "unavailable"
 
     def payload_hass_config_battery(self):
-        ret =  '{'
-        ret += '"dev":{'
-        ret += '"ids":["{}"],'.format(self.name)
-        ret += '"cns":[["mac","{}"]],'.format(self.mac)
-        ret += '"name":"{}",'.format(self.name)
-        if self.model is not None: ret += '"mdl":"{}",'.format(self.model) 
-        if self.version is not None: ret += '"sw":"{}",'.format(self.version) 
-        ret += '"mf": "Xiaomi"'
-        ret += '},'
-        ret += '"name":"battery",'
-        ret += '"~":"{}/{}",'.format(self.worker.global_topic_prefix, self.worker.format_topic(self.name))
-        ret += '"uniq_id":"{}_battery",'.format(self.name)
-        ret += '"qos":1,'
-        ret += '"stat_t":"~/battery",'
-        ret += '"unit_of_meas":"%",'
-        ret += '"dev_cla":"battery",'
-        ret += '"stat_cla":"measurement",'
-        ret += '"availability_mode":"all",'
-        ret += '"availability":['
-        ret += '{"topic":"~/online"},'
-        ret += '{{"topic":"{}/LWT"}}],'.format(self.worker.global_topic_prefix)
-        ret += '"source_type":"bluetooth_le"'
-        ret += '}'
-        return ret
+        device = {
+            "ids": [self.name],
+            "cns": [["mac", self.mac]],
+            "name": self.name,
+        }
+        if self.model is not None:
+            device["mdl"] = self.model
+        if self.version is not None:
+            device["sw"] = self.version
+        device["mf"] = "Xiaomi"
+
+        return {
+            "dev": device,
+            "name": "battery",
+            "~": "{}/{}".format(self.worker.global_topic_prefix, self.worker.format_topic(self.name)),
+            "uniq_id": "{}_battery".format(self.name),
+            "qos": 1,
+            "stat_t": "~/battery",
+            "unit_of_meas": "%",
+            "dev_cla": "battery",
+            "stat_cla": "measurement",
+            "availability_mode": "all",
+            "availability": [
+                {"topic": "~/online"},
+                {"topic": "{}/LWT".format(self.worker.global_topic_prefix)},
+            ],
+            "source_type": "bluetooth_le",
+        }
 
     def generate_messages(self):
         messages = []
@@ -112,12 +116,6 @@ class MibandWorker(BaseWorker):
             _LOGGER.info("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.last_status.append(MibandDeviceStatus(self, mac, name))            
 
-    def format_topic(self, *topic_args):
-        if hasattr(self, 'topic_prefix'):
-            return "/".join([self.topic_prefix, *topic_args])
-        else:
-            return "/".join([*topic_args])
-
     def status_update(self):
         ret = []
         for device in self.last_status:
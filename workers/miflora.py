@@ -1,6 +1,6 @@
 from const import DEFAULT_PER_DEVICE_TIMEOUT
 from exceptions import DeviceTimeoutError
-from mqtt import MqttMessage, MqttConfigMessage
+from mqtt import MqttConfigMessage
 
 from interruptingcow import timeout
 from workers.base import BaseWorker, retry
@@ -20,6 +20,7 @@ _LOGGER = logger.get(__name__)
 
 class MifloraWorker(BaseWorker):
     per_device_timeout = DEFAULT_PER_DEVICE_TIMEOUT  # type: int
+    adapter = "hci0"  # type: str
 
     def _setup(self):
         from miflora.miflora_poller import MiFloraPoller
@@ -31,7 +32,7 @@ class MifloraWorker(BaseWorker):
             self.devices[name] = {
                 "mac": mac,
                 "poller": MiFloraPoller(
-                    mac, BluepyBackend, adapter=getattr(self, 'adapter', 'hci0')),
+                    mac, BluepyBackend, adapter=self.adapter),
             }
 
     def config(self, availability_topic):
@@ -52,7 +53,7 @@ class MifloraWorker(BaseWorker):
         for attr in monitoredAttrs:
             payload = {
                 "unique_id": self.format_discovery_id(mac, name, attr),
-                "state_topic": self.format_prefixed_topic(name, attr),
+                **self.state_config(name, attr),
                 "name": self.format_discovery_name(name, attr),
                 "device": device,
             }
@@ -90,7 +91,7 @@ class MifloraWorker(BaseWorker):
                 self.format_discovery_topic(mac, name, ATTR_LOW_BATTERY),
                 payload={
                     "unique_id": self.format_discovery_id(mac, name, ATTR_LOW_BATTERY),
-                    "state_topic": self.format_prefixed_topic(name, ATTR_LOW_BATTERY),
+                    **self.state_config(name, ATTR_LOW_BATTERY),
                     "name": self.format_discovery_name(name, ATTR_LOW_BATTERY),
                     "device": device,
                     "device_class": "battery",
@@ -119,6 +120,7 @@ class MifloraWorker(BaseWorker):
                     data["mac"],
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), name, type(e).__name__),
                 )
             except DeviceTimeoutError:
                 logger.log_exception(
@@ -128,10 +130,11 @@ class MifloraWorker(BaseWorker):
                     name,
                     data["mac"],
                     suppress=True,
+                    key=(repr(self), name, "timeout"),
                 )
 
     def update_device_state(self, name, poller):
-        ret = []
+        state = {}
         poller.clear_cache()
         for attr in monitoredAttrs:
             payload = poller.parameter_value(attr)
@@ -147,19 +150,9 @@ class MifloraWorker(BaseWorker):
             if (attr == "light") and (payload > 1_000_000):
                 continue
 
-            ret.append(
-                MqttMessage(
-                    topic=self.format_topic(name, attr),
-                    payload=payload,
-                )
-            )
+            state[attr] = payload
 
         # Low battery binary sensor
-        ret.append(
-            MqttMessage(
-                topic=self.format_topic(name, ATTR_LOW_BATTERY),
-                payload=self.true_false_to_ha_on_off(poller.parameter_value(ATTR_BATTERY) < 10),
-            )
-        )
+        state[ATTR_LOW_BATTERY] = self.true_false_to_ha_on_off(poller.parameter_value(ATTR_BATTERY) < 10)
 
-        return ret
+        return self.state_messages(name, state)
@@ -18,6 +18,7 @@ REQUIREMENTS = ["bluepy"]
 class MiscaleWorker(BaseWorker):
 
     SCAN_TIMEOUT = 5
+    users = None  # type: dict
 
     def getAge(self, d1):
         d1 = datetime.strptime(str(d1), "%Y-%m-%d")
@@ -46,7 +47,7 @@ class MiscaleWorker(BaseWorker):
                 )
             )
 
-        if hasattr(self, "users"):
+        if self.users:
             for key, item in self.users.items():
                 if (
                     item["weight_template"]["min"]
@@ -1,6 +1,6 @@
 from const import DEFAULT_PER_DEVICE_TIMEOUT
 from exceptions import DeviceTimeoutError
-from mqtt import MqttMessage, MqttConfigMessage
+from mqtt import MqttConfigMessage
 from interruptingcow import timeout
 
 from workers.base import BaseWorker, retry
@@ -45,7 +45,7 @@ class MithermometerWorker(BaseWorker):
             payload = {
                 "unique_id": self.format_discovery_id(mac, name, attr),
                 "name": self.format_discovery_name(name, attr),
-                "state_topic": self.format_prefixed_topic(name, attr),
+                **self.state_config(name, attr),
                 "device_class": attr,
                 "device": device,
             }
@@ -86,6 +86,7 @@ class MithermometerWorker(BaseWorker):
                     data["mac"],
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), name, type(e).__name__),
                 )
             except DeviceTimeoutError:
                 logger.log_exception(
@@ -95,16 +96,11 @@ class MithermometerWorker(BaseWorker):
                     name,
                     data["mac"],
                     suppress=True,
+                    key=(repr(self), name, "timeout"),
                 )
 
     def update_device_state(self, name, poller):
-        ret = []
         poller.clear_cache()
-        for attr in monitoredAttrs:
-            ret.append(
-                MqttMessage(
-                    topic=self.format_topic(name, attr),
-                    payload=poller.parameter_value(attr),
-                )
-            )
-        return ret
+        return self.state_messages(
+            name, {attr: poller.parameter_value(attr) for attr in monitoredAttrs}
+        )
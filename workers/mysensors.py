@@ -12,7 +12,7 @@ class MysensorsWorker(BaseWorker):
         import serial
 
         with serial.Serial(self.port, self.baudrate, timeout=10) as ser:
-            _LOGGER.debug("Starting mysensors at: %s" % ser.name)
+            _LOGGER.debug("Starting mysensors at: %s", ser.name)
             while True:
                 line = ser.readline()
                 if not line:
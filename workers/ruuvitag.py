@@ -1,4 +1,4 @@
-from mqtt import MqttMessage, MqttConfigMessage
+from mqtt import MqttConfigMessage
 from workers.base import BaseWorker
 
 import logger
@@ -46,6 +46,8 @@ ATTR_CONFIG = [
     ("tx_power", "none", "dBm"),
 ]
 ATTR_LOW_BATTERY = "low_battery"
+# Attributes are published below their device class in the per-attribute state format
+ATTR_SUBTOPICS = {attr: device_class for attr, device_class, _ in ATTR_CONFIG}
 # "[Y]ou should plan to replace the battery when the voltage drops below 2.5 volts"
 # Source: https://github.com/ruuvi/ruuvitag_fw/wiki/FAQ:-battery
 LOW_BATTERY_VOLTAGE = 2500
@@ -76,11 +78,11 @@ class RuuvitagWorker(BaseWorker):
             "name": self.format_discovery_name(name),
         }
 
-        for _, device_class, unit in ATTR_CONFIG:
+        for attr, device_class, unit in ATTR_CONFIG:
             payload = {
                 "unique_id": self.format_discovery_id(mac, name, device_class),
                 "name": self.format_discovery_name(name, device_class),
-                "state_topic": self.format_prefixed_topic(name, device_class),
+                **self.state_config(name, attr, device_class),
                 "device": device,
                 "device_class": device_class,
                 "unit_of_measurement": unit,
@@ -101,7 +103,7 @@ class RuuvitagWorker(BaseWorker):
                 payload={
                     "unique_id": self.format_discovery_id(mac, name, ATTR_LOW_BATTERY),
                     "name": self.format_discovery_name(name, ATTR_LOW_BATTERY),
-                    "state_topic": self.format_prefixed_topic(name, ATTR_LOW_BATTERY),
+                    **self.state_config(name, ATTR_LOW_BATTERY),
                     "device": device,
                     "device_class": "battery",
                 },
@@ -128,38 +130,24 @@ class RuuvitagWorker(BaseWorker):
                     device.mac,
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), name, type(e).__name__),
                 )
         return ret
 
     def update_device_state(self, name, device):
         values = device.update()
 
-        ret = []
-        for attr, device_class, _ in ATTR_CONFIG:
-            try:
-                ret.append(
-                    MqttMessage(
-                        topic=self.format_topic(name, device_class),
-                        payload=values[attr],
-                    )
-                )
-            except KeyError:
-                # The data format of this sensor doesn't have this attribute, so ignore it.
-                pass
+        state = {}
+        for attr, _, _ in ATTR_CONFIG:
+            # The data format of this sensor may not have this attribute, so ignore it.
+            if attr in values:
+                state[attr] = values[attr]
 
         # Low battery binary sensor
         #
-        try:
-            ret.append(
-                MqttMessage(
-                    topic=self.format_topic(name, ATTR_LOW_BATTERY),
-                    payload=self.true_false_to_ha_on_off(
-                        values["battery"] < LOW_BATTERY_VOLTAGE
-                    ),
-                )
+        if "battery" in values:
+            state[ATTR_LOW_BATTERY] = self.true_false_to_ha_on_off(
+                values["battery"] < LOW_BATTERY_VOLTAGE
             )
-        except KeyError:
-            # The data format of this sensor doesn't have the battery attribute, so ignore it.
-            pass
 
-        return ret
+        return self.state_messages(name, state, ATTR_SUBTOPICS)
@@ -1,4 +1,4 @@
-from mqtt import MqttMessage, MqttConfigMessage
+from mqtt import MqttConfigMessage
 from workers.base import BaseWorker
 
 import logger
@@ -11,6 +11,8 @@ ATTR_CONFIG = [
     ("humidity", "humidity", "%"),
     ("battery_level", "battery", "%"),
 ]
+# Attributes are published below their device class in the per-attribute state format
+ATTR_SUBTOPICS = {attr: device_class for attr, device_class, _ in ATTR_CONFIG}
 _LOGGER = logger.get(__name__)
 
 
@@ -42,7 +44,7 @@ class SmartgadgetWorker(BaseWorker):
             payload = {
                 "unique_id": self.format_discovery_id(mac, name, device_class),
                 "name": self.format_discovery_name(name, device_class),
-                "state_topic": self.format_prefixed_topic(name, device_class),
+                **self.state_config(name, attr, device_class),
                 "device": device,
                 "device_class": device_class,
                 "unit_of_measurement": unit,
@@ -74,17 +76,12 @@ class SmartgadgetWorker(BaseWorker):
                     device.mac,
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), name, type(e).__name__),
                 )
 
     def update_device_state(self, name, device):
         values = device.get_values()
 
-        ret = []
-        for attr, device_class, _ in ATTR_CONFIG:
-            ret.append(
-                MqttMessage(
-                    topic=self.format_topic(name, device_class), payload=values[attr]
-                )
-            )
-
-        return ret
+        return self.state_messages(
+            name, {attr: values[attr] for attr, _, _ in ATTR_CONFIG}, ATTR_SUBTOPICS
+        )
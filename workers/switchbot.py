@@ -1,4 +1,5 @@
 from mqtt import MqttMessage
+from topics import TopicRegistry
 
 from workers.base import BaseWorker, retry
 import logger
@@ -20,14 +21,30 @@ CHARACTERISTIC_UUID = "cba20002-224d-11e6-9fb8-0002a5d5c51b"
 
 class SwitchbotWorker(BaseWorker):
     def _setup(self):
+        # States aren't published below the topic_prefix the commands are subscribed to
+        self.state_topics = TopicRegistry(self.state_topic_prefix)
 
         _LOGGER.info("Adding %d %s devices", len(self.devices), repr(self))
         for name, mac in self.devices.items():
             _LOGGER.info("Adding %s device '%s' (%s)", repr(self), name, mac)
             self.devices[name] = {"bot": None, "state": STATE_OFF, "mac": mac}
+            self.state_topics.register(name)
+
+    def snapshot(self):
+        return {bot["mac"]: bot["state"] for bot in self.devices.values()}
+
+    def restore(self, state):
+        # Optimistic states, the bots can't be queried
+        for bot in self.devices.values():
+            if bot["mac"] in state:
+                bot["state"] = state[bot["mac"]]
 
     def format_state_topic(self, *args):
-        return "/".join([self.state_topic_prefix, *args])
+        return self.state_topics.topic(*args)
+
+    @property
+    def device_topics(self):
+        return super().device_topics + list(self.state_topics.registered.values())
 
     def status_update(self):
 
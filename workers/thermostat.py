@@ -1,4 +1,4 @@
-from mqtt import MqttMessage, MqttConfigMessage
+from mqtt import MqttConfigMessage
 
 from workers.base import BaseWorker, retry
 import logger
@@ -24,6 +24,10 @@ SENSOR_VALVE = "valve_state"
 SENSOR_AWAY_END = "away_end"
 SENSOR_TARGET_TEMPERATURE = "target_temperature"
 
+# Values templates of the JSON state format, booleans are compared to payload_on/payload_off as published
+TEMPLATE_BOOLEAN = "{{{{ value_json.{} | lower }}}}"
+TEMPLATE_JSON = "{{{{ value_json.{} | tojson }}}}"
+
 monitoredAttrs = [
     SENSOR_BATTERY,
     SENSOR_VALVE,
@@ -82,18 +86,32 @@ class ThermostatWorker(BaseWorker):
             "name": self.format_discovery_name(name, SENSOR_CLIMATE),
             "qos": 1,
             "availability_topic": availability_topic,
-            "temperature_state_topic": self.format_prefixed_topic(
-                name, SENSOR_TARGET_TEMPERATURE
+            **self.state_config(
+                name,
+                SENSOR_TARGET_TEMPERATURE,
+                topic_key="temperature_state_topic",
+                template_key="temperature_state_template",
             ),
             "temperature_command_topic": self.format_prefixed_topic(
                 name, SENSOR_TARGET_TEMPERATURE, "set"
             ),
-            "mode_state_topic": self.format_prefixed_topic(name, "mode"),
+            **self.state_config(
+                name, "mode", topic_key="mode_state_topic", template_key="mode_state_template"
+            ),
             "mode_command_topic": self.format_prefixed_topic(name, "mode", "set"),
-            "preset_mode_state_topic": self.format_prefixed_topic(name, "preset"),
+            **self.state_config(
+                name,
+                "preset",
+                topic_key="preset_mode_state_topic",
+                template_key="preset_mode_value_template",
+            ),
             "preset_mode_command_topic": self.format_prefixed_topic(name, "preset", "set"),
-            "json_attributes_topic": self.format_prefixed_topic(
-                name, "json_attributes"
+            **self.state_config(
+                name,
+                "json_attributes",
+                topic_key="json_attributes_topic",
+                template_key="json_attributes_template",
+                template=TEMPLATE_JSON,
             ),
             "min_temp": 5.0,
             "max_temp": 29.5,
@@ -119,7 +137,7 @@ class ThermostatWorker(BaseWorker):
         payload = {
             "unique_id": self.format_discovery_id(mac, name, SENSOR_WINDOW),
             "name": self.format_discovery_name(name, SENSOR_WINDOW),
-            "state_topic": self.format_prefixed_topic(name, SENSOR_WINDOW),
+            **self.state_config(name, SENSOR_WINDOW, template=TEMPLATE_BOOLEAN),
             "availability_topic": availability_topic,
             "device_class": "window",
             "payload_on": "true",
@@ -137,7 +155,7 @@ class ThermostatWorker(BaseWorker):
         payload = {
             "unique_id": self.format_discovery_id(mac, name, SENSOR_BATTERY),
             "name": self.format_discovery_name(name, SENSOR_BATTERY),
-            "state_topic": self.format_prefixed_topic(name, SENSOR_BATTERY),
+            **self.state_config(name, SENSOR_BATTERY, template=TEMPLATE_BOOLEAN),
             "availability_topic": availability_topic,
             "device_class": "battery",
             "payload_on": "true",
@@ -155,7 +173,7 @@ class ThermostatWorker(BaseWorker):
         payload = {
             "unique_id": self.format_discovery_id(mac, name, SENSOR_LOCKED),
             "name": self.format_discovery_name(name, SENSOR_LOCKED),
-            "state_topic": self.format_prefixed_topic(name, SENSOR_LOCKED),
+            **self.state_config(name, SENSOR_LOCKED, template=TEMPLATE_BOOLEAN),
             "availability_topic": availability_topic,
             "device_class": "lock",
             "payload_on": "false",
@@ -173,7 +191,7 @@ class ThermostatWorker(BaseWorker):
         payload = {
             "unique_id": self.format_discovery_id(mac, name, SENSOR_VALVE),
             "name": self.format_discovery_name(name, SENSOR_VALVE),
-            "state_topic": self.format_prefixed_topic(name, SENSOR_VALVE),
+            **self.state_config(name, SENSOR_VALVE),
             "availability_topic": availability_topic,
             "device_class": "power_factor",
             "unit_of_measurement": "%",
@@ -208,6 +226,7 @@ class ThermostatWorker(BaseWorker):
                     data["mac"],
                     type(e).__name__,
                     suppress=True,
+                    key=(repr(self), name, type(e).__name__),
                 )
             else:
                 yield retry(self.present_device_state, retries=self.update_retries, exception_type=btle.BTLEException)(name, thermostat)
@@ -294,11 +313,11 @@ class ThermostatWorker(BaseWorker):
     def present_device_state(self, name, thermostat):
         from eq3bt import Mode
 
-        ret = []
+        state = {}
         attributes = {}
         for attr in monitoredAttrs:
             value = getattr(thermostat, attr)
-            ret.append(MqttMessage(topic=self.format_topic(name, attr), payload=value))
+            state[attr] = value
 
             if attr != SENSOR_TARGET_TEMPERATURE:
                 attributes[attr] = value
@@ -308,11 +327,7 @@ class ThermostatWorker(BaseWorker):
         else:
             attributes[SENSOR_AWAY_END] = None
 
-        ret.append(
-            MqttMessage(
-                topic=self.format_topic(name, "json_attributes"), payload=attributes
-            )
-        )
+        state["json_attributes"] = attributes
 
         mapping = {
             Mode.Auto: MODE_AUTO,
@@ -332,7 +347,7 @@ class ThermostatWorker(BaseWorker):
         else:
             preset = PRESET_NONE
 
-        ret.append(MqttMessage(topic=self.format_topic(name, "mode"), payload=mode))
-        ret.append(MqttMessage(topic=self.format_topic(name, "preset"), payload=preset))
+        state["mode"] = mode
+        state["preset"] = preset
 
-        return ret
+        return self.state_messages(name, state)
@@ -26,7 +26,7 @@ class ToothbrushWorker(BaseWorker):
 
             def handleDiscovery(self, dev, isNewDev, isNewData):
                 if isNewDev:
-                    _LOGGER.debug("Discovered new device: %s" % dev.addr)
+                    _LOGGER.debug("Discovered new device: %s", dev.addr)
 
         scanner = Scanner().withDelegate(ScanDelegate())
         devices = scanner.scan(5.0)
@@ -52,7 +52,7 @@ class ToothbrushWorker(BaseWorker):
                         topic=self.format_topic(name + "/presence"), payload="1"
                     )
                 )
-                _LOGGER.debug("text: %s" % device.getValueText(255))
+                _LOGGER.debug("text: %s", device.getValueText(255))
                 bytes_ = bytearray(bytes.fromhex(device.getValueText(255)))
                 ret.append(
                     MqttMessage(
@@ -1,5 +1,3 @@
-import json
-
 from mqtt import MqttMessage
 
 from workers.base import BaseWorker
@@ -51,6 +49,16 @@ BRUSHSECTORS = {
 class Toothbrush_HomeassistantWorker(BaseWorker):
     def _setup(self):
         self.autoconfCache = {}
+        for key in self.devices:
+            for subtopic in ("presence", "state", "attributes"):
+                self.topics.register(key, subtopic)
+
+    def snapshot(self):
+        return sorted(self.autoconfCache)
+
+    def restore(self, state):
+        # Autodiscovery configs already sent
+        self.autoconfCache = {key: True for key in state}
 
     def searchmac(self, devices, mac):
         for dev in devices:
@@ -66,9 +74,9 @@ class Toothbrush_HomeassistantWorker(BaseWorker):
             return {
                 "platform": "mqtt",
                 "name": name,
-                "state_topic": self.topic_prefix + "/" + key + "/state",
-                "availability_topic": self.topic_prefix + "/" + key + "/presence",
-                "json_attributes_topic": self.topic_prefix + "/" + key + "/attributes",
+                "state_topic": self.format_topic(key, "state"),
+                "availability_topic": self.format_topic(key, "presence"),
+                "json_attributes_topic": self.format_topic(key, "attributes"),
                 "icon": "mdi:tooth-outline",
             }
 
@@ -99,7 +107,7 @@ class Toothbrush_HomeassistantWorker(BaseWorker):
 
             def handleDiscovery(self, dev, isNewDev, isNewData):
                 if isNewDev:
-                    _LOGGER.debug("Discovered new device: %s" % dev.addr)
+                    _LOGGER.debug("Discovered new device: %s", dev.addr)
 
         scanner = Scanner().withDelegate(ScanDelegate())
         devices = scanner.scan(5.0)
@@ -118,7 +126,7 @@ class Toothbrush_HomeassistantWorker(BaseWorker):
 
             if device is not None:
                 bytes_ = bytearray.fromhex(device.getValueText(255))
-                _LOGGER.debug("text: %s" % device.getValueText(255))
+                _LOGGER.debug("text: %s", device.getValueText(255))
 
                 if bytes_[5] > 0:
                     rssi = device.rssi
@@ -140,19 +148,19 @@ class Toothbrush_HomeassistantWorker(BaseWorker):
 
             ret.append(
                 MqttMessage(
-                    topic=self.format_topic(key + "/presence"), payload=presence_value
+                    topic=self.format_topic(key, "presence"), payload=presence_value
                 )
             )
             ret.append(
                 MqttMessage(
-                    topic=self.format_topic(key + "/state"),
+                    topic=self.format_topic(key, "state"),
                     payload=self.get_state(state),
                 )
             )
             ret.append(
                 MqttMessage(
-                    topic=self.format_topic(key + "/attributes"),
-                    payload=json.dumps(attributes),
+                    topic=self.format_topic(key, "attributes"),
+                    payload=attributes,
                 )
             )
 
@@ -160,13 +168,14 @@ class Toothbrush_HomeassistantWorker(BaseWorker):
             if autoconf_data != False:
                 ret.append(
                     MqttMessage(
-                        topic=self.autodiscovery_prefix
-                        + "/sensor/"
-                        + self.topic_prefix
-                        + "_"
-                        + key
-                        + "/config",
-                        payload=json.dumps(autoconf_data),
+                        topic=self.topics.cached(
+                            ("autoconf", key),
+                            "{}/sensor/{}_{}/config".format,
+                            self.autodiscovery_prefix,
+                            self.topic_prefix,
+                            key,
+                        ),
+                        payload=autoconf_data,
                         retain=True,
                     )
                 )
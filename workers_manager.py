@@ -1,14 +1,17 @@
+import copy
 import importlib
 import inspect
 import threading
+import time
 from functools import partial
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from interruptingcow import timeout
 from pytz import utc
+import yaml
 
-from const import DEFAULT_COMMAND_TIMEOUT, DEFAULT_COMMAND_RETRIES, DEFAULT_UPDATE_RETRIES
-from exceptions import WorkerTimeoutError
+from exceptions import ConfigError, WorkerTimeoutError
+from snapshot import StateSnapshot
 from workers_queue import _WORKERS_QUEUE
 import logger
 
@@ -49,7 +52,7 @@ class WorkersManager:
             except WorkerTimeoutError as e:
                 if messages:
                     logger.log_exception(
-                        _LOGGER, "%s, sending only partial update", e, suppress=True
+                        _LOGGER, "%s, sending only partial update", e, suppress=True, key=(self._source, "partial")
                     )
                 else:
                     raise e
@@ -57,108 +60,359 @@ class WorkersManager:
             _LOGGER.debug("Execution result of command %s: %s", self._source, messages)
             return messages
 
+    class Registration:
+        """
+        Everything registered for a worker, so it can be removed again on reload
+        """
+        def __init__(self, config, worker_obj):
+            self.config = config
+            self.worker_obj = worker_obj
+            self.command = None
+            self.job_id = None
+            self.config_timeout = None
+            self.daemon = False
+            self.topics = []
+
     def __init__(self, config, mqtt_config):
         self._mqtt_callbacks = []
-        self._config_commands = []
-        self._update_commands = []
+        self._registrations = {}
+        self._manager_topics = []
         self._scheduler = BackgroundScheduler(timezone=utc)
-        self._daemons = []
         self._config = config
-        self._command_timeout = config.get("command_timeout", DEFAULT_COMMAND_TIMEOUT)
-        self._command_retries = config.get("command_retries", DEFAULT_COMMAND_RETRIES)
-        self._update_retries = config.get("update_retries", DEFAULT_UPDATE_RETRIES)
+        self._command_timeout = config.command_timeout
         self._mqtt = mqtt_config
+        self._global_topic_prefix = None
+        self._started = False
+        self._reload_requested = False
+        # Settings of the snapshot are only read at startup
+        self._snapshot = StateSnapshot(config.state_snapshot) if config.state_snapshot else None
+        self._snapshot_interval = config.state_snapshot_interval
 
     def register_workers(self, global_topic_prefix):
-        for (worker_name, worker_config) in self._config["workers"].items():
-            module_obj = importlib.import_module("workers.%s" % worker_name)
-            klass = getattr(module_obj, "%sWorker" % worker_name.title())
+        self._global_topic_prefix = global_topic_prefix
+        for worker_config in self._config.workers:
+            self._registrations[worker_config.name] = self._register_worker(
+                worker_config, self._config.sensor_config
+            )
+        self._register_manager_callbacks(self._config.topic_subscription)
+
+    def _register_worker(self, worker_config, sensor_config, state=None):
+        worker_name = worker_config.name
+        module_obj = importlib.import_module("workers.%s" % worker_config.type)
+        klass = getattr(module_obj, "%sWorker" % worker_config.type.title())
+
+        # Workers own their args, the compiled config stays untouched
+        worker_obj = klass(
+            worker_config.command_timeout,
+            worker_config.command_retries,
+            worker_config.update_retries,
+            self._global_topic_prefix,
+            instance_name=worker_name,
+            **copy.deepcopy(dict(worker_config.args))
+        )
+        registration = self.Registration(worker_config, worker_obj)
+        self._mqtt.register_topics(worker_obj.device_topics)
+        if state is None and self._snapshot is not None:
+            state = self._snapshot.pop(worker_name)
+        if state is not None and hasattr(worker_obj, "restore"):
+            try:
+                worker_obj.restore(state)
+                _LOGGER.debug("Restored state of %s", repr(worker_obj))
+            except Exception as e:
+                logger.log_exception(_LOGGER, "Unable to restore state of %s: %s", repr(worker_obj), type(e).__name__)
 
-            command_timeout = worker_config.get(
-                "command_timeout", self._command_timeout
+        if not hasattr(worker_obj, "status_update") and not hasattr(worker_obj, "run"):
+            raise ConfigError(
+                "%s cannot be initialized, it has to define run or status_update method" % worker_name
             )
-            command_retries = worker_config.get(
-                "command_retries", self._command_retries
+
+        self._apply_publish_policy(registration)
+
+        if sensor_config is not None and hasattr(worker_obj, "config"):
+            _LOGGER.debug(
+                "Added %s config with a %d seconds timeout", repr(worker_obj), worker_config.config_timeout
             )
-            update_retries = worker_config.get(
-                "update_retries", self._update_retries
+            registration.config_timeout = worker_config.config_timeout
+
+        if hasattr(worker_obj, "status_update") and not getattr(worker_obj, "persistent", False):
+            _LOGGER.debug(
+                "Added %s worker with %s seconds interval and a %d seconds timeout",
+                repr(worker_obj),
+                worker_config.update_interval,
+                worker_obj.command_timeout,
             )
-            worker_obj = klass(
-                command_timeout, command_retries, update_retries, global_topic_prefix, **worker_config["args"]
+            registration.command = self.Command(
+                worker_obj.status_update, worker_obj.command_timeout, []
             )
 
-            if "sensor_config" in self._config and hasattr(worker_obj, "config"):
-                _LOGGER.debug(
-                    "Added %s config with a %d seconds timeout", repr(worker_obj), 2
+            if worker_config.update_interval is not None:
+                registration.job_id = "{}_interval_job".format(worker_name)
+                self._scheduler.add_job(
+                    partial(self._queue_command, registration.command),
+                    "interval",
+                    seconds=worker_config.update_interval,
+                    id=registration.job_id,
                 )
-                command = self.Command(worker_obj.config, 2, [self._mqtt.availability_topic])
-                self._config_commands.append(command)
-
-            if hasattr(worker_obj, "status_update"):
-                _LOGGER.debug(
-                    "Added %s worker with %d seconds interval and a %d seconds timeout",
-                    repr(worker_obj),
-                    worker_config["update_interval"],
-                    worker_obj.command_timeout,
+                self._subscribe(
+                    registration.topics,
+                    worker_obj.format_topic("update_interval"),
+                    partial(self._update_interval_wrapper, registration.command, registration.job_id),
                 )
-                command = self.Command(
-                    worker_obj.status_update, worker_obj.command_timeout, []
+        else:
+            _LOGGER.debug("Registered %s as daemon", repr(worker_obj))
+            registration.daemon = True
+
+        if worker_config.topic_subscription is not None:
+            self._subscribe(
+                registration.topics,
+                worker_config.topic_subscription,
+                partial(self._on_command_wrapper, worker_obj),
+            )
+
+        return registration
+
+    def _register_manager_callbacks(self, topic_subscription):
+        for (callback_name, options) in topic_subscription.items():
+            if not callable(getattr(self, callback_name, None)):
+                raise ConfigError("Unknown topic_subscription callback '%s'" % callback_name)
+            self._subscribe(
+                self._manager_topics,
+                options["topic"],
+                partial(self._on_manager_callback, callback_name, options["payload"]),
+            )
+
+    def _subscribe(self, topics, topic, callback):
+        topics.append(topic)
+        if self._started:
+            self._mqtt.subscribe(topic, callback)
+        else:
+            self._mqtt_callbacks.append((topic, callback))
+
+    def _apply_publish_policy(self, registration):
+        worker_config = registration.config
+        worker_obj = registration.worker_obj
+        if worker_config.publish_on_change is not None or worker_config.publish_heartbeat is not None:
+            if getattr(worker_obj, "topic_prefix", None):
+                self._mqtt.add_publish_policy(
+                    worker_obj.topic_prefix,
+                    worker_config.publish_on_change,
+                    worker_config.publish_heartbeat,
                 )
-                self._update_commands.append(command)
-
-                if "update_interval" in worker_config:
-                    job_id = "{}_interval_job".format(worker_name)
-                    self._scheduler.add_job(
-                        partial(self._queue_command, command),
-                        "interval",
-                        seconds=worker_config["update_interval"],
-                        id=job_id,
-                    )
-                    self._mqtt_callbacks.append(
-                        (
-                            worker_obj.format_topic("update_interval"),
-                            partial(self._update_interval_wrapper, command, job_id),
-                        )
-                    )
-            elif hasattr(worker_obj, "run"):
-                _LOGGER.debug("Registered %s as daemon", repr(worker_obj))
-                self._daemons.append(worker_obj)
             else:
-                raise "%s cannot be initialized, it has to define run or status_update method" % worker_name
+                _LOGGER.warning("Publish cache settings of %s need a topic_prefix, ignoring", repr(worker_obj))
+        elif getattr(worker_obj, "topic_prefix", None):
+            self._mqtt.remove_publish_policy(worker_obj.topic_prefix)
 
-            if "topic_subscription" in worker_config:
-                self._mqtt_callbacks.append(
-                    (
-                        worker_config["topic_subscription"],
-                        partial(self._on_command_wrapper, worker_obj),
-                    )
-                )
+    def _unregister_worker(self, registration):
+        worker_obj = registration.worker_obj
+        if registration.job_id is not None:
+            self._scheduler.remove_job(registration.job_id)
+        for topic in registration.topics:
+            self._mqtt.unsubscribe(topic)
+        if registration.config.publish_on_change is not None or registration.config.publish_heartbeat is not None:
+            if getattr(worker_obj, "topic_prefix", None):
+                self._mqtt.remove_publish_policy(worker_obj.topic_prefix)
+        if hasattr(worker_obj, "stop"):
+            worker_obj.stop()
+        elif registration.daemon:
+            _LOGGER.warning("%s can't be stopped, it keeps running until restarted", repr(worker_obj))
+        _LOGGER.debug("Removed %s", repr(worker_obj))
 
-        if "topic_subscription" in self._config:
-            for (callback_name, options) in self._config["topic_subscription"].items():
-                self._mqtt_callbacks.append(
-                    (
-                        options["topic"],
-                        lambda client, _, c: self._queue_if_matching_payload(
-                            self.Command(
-                                getattr(self, callback_name), self._command_timeout
-                            ),
-                            c.payload,
-                            options["payload"],
-                        ),
-                    )
-                )
+    def _start_worker(self, registration):
+        if registration.daemon:
+            threading.Thread(target=registration.worker_obj.run, args=[self._mqtt], daemon=True).start()
 
     def start(self):
         self._mqtt.callbacks_subscription(self._mqtt_callbacks)
+        self._mqtt_callbacks = []
+        self._started = True
 
-        if "sensor_config" in self._config:
-            self._publish_config()
-
+        if self._snapshot is not None:
+            self._scheduler.add_job(
+                self.save_state, "interval", seconds=self._snapshot_interval, id="state_snapshot_job"
+            )
         self._scheduler.start()
         self.update_all()
-        for daemon in self._daemons:
-            threading.Thread(target=daemon.run, args=[self._mqtt], daemon=True).start()
+        for registration in self._registrations.values():
+            self._start_worker(registration)
+
+        # Discovery configs don't hold up the first status updates
+        self._start_publish_config(self._registrations.values(), self._config.sensor_config)
+
+    def stop(self):
+        self._scheduler.shutdown(wait=False)
+        self.save_state()
+        for registration in self._registrations.values():
+            if hasattr(registration.worker_obj, "stop"):
+                registration.worker_obj.stop()
+
+    def save_state(self):
+        if self._snapshot is None:
+            return
+
+        states = {}
+        for name, registration in list(self._registrations.items()):
+            state = self._worker_state(registration)
+            if state is not None:
+                states[name] = state
+        self._snapshot.save(states)
+
+    @staticmethod
+    def _worker_state(registration):
+        if not hasattr(registration.worker_obj, "snapshot"):
+            return None
+        try:
+            return registration.worker_obj.snapshot()
+        except Exception as e:
+            logger.log_exception(
+                _LOGGER, "Unable to snapshot state of %s: %s", repr(registration.worker_obj), type(e).__name__
+            )
+            return None
+
+    def request_reload(self):
+        """
+        Have the main loop reload the configuration, safe to call from signal handlers and MQTT callbacks
+        """
+        self._reload_requested = True
+
+    def reload_if_requested(self):
+        # A reload must not be interrupted by a command timeout, it isn't queued as a command
+        if not self._reload_requested:
+            return
+        self._reload_requested = False
+        _LOGGER.info("Reloading configuration")
+        self.reload_config()
+
+    def reload_config(self):
+        """
+        Re-read config.yaml and apply the differences to the running workers. Unchanged workers keep
+        their connections, caches and schedule; only added, removed or changed workers are touched.
+        The new configuration is only taken over once all of it was applied.
+        """
+        from config import load_settings, manager_config
+
+        try:
+            config = manager_config(load_settings()["manager"])
+        except (ConfigError, OSError, KeyError, TypeError, yaml.YAMLError) as e:
+            logger.log_exception(_LOGGER, "Not reloading invalid configuration: %s", e)
+            return
+
+        remaining = dict(self._registrations)
+        registrations = {}
+        started = []
+        removed = updated = 0
+        try:
+            if config.topic_subscription != self._config.topic_subscription:
+                for topic in self._manager_topics:
+                    self._mqtt.unsubscribe(topic)
+                self._manager_topics = []
+                try:
+                    self._register_manager_callbacks(config.topic_subscription)
+                except ConfigError as e:
+                    logger.log_exception(_LOGGER, "Error reloading topic subscriptions: %s", e)
+
+            for name in remaining.keys() - {worker_config.name for worker_config in config.workers}:
+                self._unregister_worker(remaining.pop(name))
+                removed += 1
+
+            for worker_config in config.workers:
+                registration = remaining.get(worker_config.name)
+                if registration is not None and registration.config == worker_config:
+                    registrations[worker_config.name] = remaining.pop(worker_config.name)
+                    continue
+                if registration is not None and self._update_worker(registration, worker_config):
+                    registrations[worker_config.name] = remaining.pop(worker_config.name)
+                    updated += 1
+                    continue
+
+                if registration is not None and registration.daemon and not hasattr(registration.worker_obj, "stop"):
+                    # A second instance would share the device with the one still running
+                    _LOGGER.warning(
+                        "%s can't be stopped, restart required to apply its changed configuration",
+                        repr(registration.worker_obj),
+                    )
+                    registrations[worker_config.name] = remaining.pop(worker_config.name)
+                    continue
+
+                # A recreated worker continues from the state of the one it replaces
+                state = None
+                if registration is not None:
+                    state = self._worker_state(registration)
+                    self._unregister_worker(remaining.pop(worker_config.name))
+                try:
+                    registration = self._register_worker(worker_config, config.sensor_config, state)
+                except Exception as e:
+                    logger.log_exception(
+                        _LOGGER, "Error loading worker %s: %s", worker_config.name, type(e).__name__
+                    )
+                    continue
+                registrations[worker_config.name] = registration
+                started.append(registration)
+        except Exception as e:
+            # Workers not reached keep running as they were, the next reload applies the rest
+            logger.log_exception(_LOGGER, "Error reloading configuration: %s", type(e).__name__)
+            registrations.update(remaining)
+            applied = False
+        else:
+            applied = True
+
+        self._registrations = registrations
+        _LOGGER.info(
+            "Reloaded configuration: %d workers started, %d removed, %d updated",
+            len(started),
+            removed,
+            updated,
+        )
+
+        # Only the new workers are polled right away, the others stay on their schedule
+        for registration in started:
+            self._start_worker(registration)
+            if registration.command is not None:
+                self._queue_command(registration.command)
+
+        if applied:
+            self._config = config
+            self._command_timeout = config.command_timeout
+        self._start_publish_config(started, config.sensor_config)
+
+    def _update_worker(self, registration, worker_config):
+        """
+        Apply a changed worker config to the running worker where possible
+        :return: False when the worker has to be recreated
+        """
+        old_config = registration.config
+        in_place = {
+            "update_interval": worker_config.update_interval,
+            "publish_on_change": worker_config.publish_on_change,
+            "publish_heartbeat": worker_config.publish_heartbeat,
+            "config_timeout": worker_config.config_timeout,
+        }
+        if old_config._replace(**in_place) != worker_config:
+            return False
+        if (old_config.update_interval is None) != (worker_config.update_interval is None):
+            return False
+
+        if registration.job_id is not None and old_config.update_interval != worker_config.update_interval:
+            # Rescheduling restarts the interval, a changed interval has no phase to keep
+            self._scheduler.reschedule_job(
+                registration.job_id, trigger="interval", seconds=worker_config.update_interval
+            )
+        registration.config = worker_config
+        self._apply_publish_policy(registration)
+        if registration.config_timeout is not None:
+            registration.config_timeout = worker_config.config_timeout
+        return True
+
+    def _on_manager_callback(self, callback_name, expected_payload, client, userdata, c):
+        if callback_name == "reload_config":
+            if c.payload.decode("utf-8") == expected_payload:
+                self.request_reload()
+            return
+        self._queue_if_matching_payload(
+            self.Command(getattr(self, callback_name), self._command_timeout),
+            c.payload,
+            expected_payload,
+        )
 
     def _queue_if_matching_payload(self, command, payload, expected_payload):
         if payload.decode("utf-8") == expected_payload:
@@ -166,8 +420,11 @@ class WorkersManager:
 
     def update_all(self):
         _LOGGER.debug("Updating all workers")
-        for command in self._update_commands:
-            self._queue_command(command)
+        # Everything has been requested again, so also republish unchanged values
+        self._mqtt.reset_publish_cache()
+        for registration in self._registrations.values():
+            if registration.command is not None:
+                self._queue_command(registration.command)
 
     @staticmethod
     def _queue_command(command):
@@ -205,13 +462,77 @@ class WorkersManager:
             )
         )
 
-    def _publish_config(self):
-        for command in self._config_commands:
-            messages = command.execute()
+    def _generate_config(self, worker_obj, results):
+        try:
+            if inspect.isgeneratorfunction(worker_obj.config):
+                messages = []
+                for message in worker_obj.config(self._mqtt.availability_topic):
+                    messages += message
+            else:
+                messages = worker_obj.config(self._mqtt.availability_topic)
+        except Exception as e:
+            logger.log_exception(
+                _LOGGER, "Error generating config of %s: %s", repr(worker_obj), type(e).__name__
+            )
+        else:
+            results[worker_obj] = messages
+
+    def _start_publish_config(self, registrations, sensor_config):
+        config_workers = [
+            (registration.worker_obj, registration.config_timeout)
+            for registration in registrations
+            if registration.config_timeout is not None
+        ]
+        if config_workers:
+            threading.Thread(
+                target=self._publish_config,
+                args=(config_workers, sensor_config),
+                name="publish-config",
+                daemon=True,
+            ).start()
+
+    def _publish_config(self, config_workers, sensor_config):
+        # Generated concurrently in threads, workers running late are published without their configs
+        results = {}
+        threads = []
+        started = time.monotonic()
+        for worker_obj, config_timeout in config_workers:
+            thread = threading.Thread(
+                target=self._generate_config,
+                args=(worker_obj, results),
+                name="config-{}".format(repr(worker_obj)),
+                daemon=True,
+            )
+            thread.start()
+            threads.append((worker_obj, config_timeout, thread))
+
+        config_messages = []
+        for worker_obj, config_timeout, thread in threads:
+            thread.join(max(0, started + config_timeout - time.monotonic()))
+            if thread.is_alive():
+                _LOGGER.warning(
+                    "Generating config of %s timed out after %d seconds, skipping it",
+                    repr(worker_obj),
+                    config_timeout,
+                )
+                continue
+            messages = results.get(worker_obj) or []
             for msg in messages:
                 msg.topic = "{}/{}".format(
-                    self._config["sensor_config"].get("topic", "homeassistant"),
+                    sensor_config.get("topic", "homeassistant"),
                     msg.topic,
                 )
-                msg.retain = self._config["sensor_config"].get("retain", True)
-            self._mqtt.publish(messages)
+                msg.retain = sensor_config.get("retain", True)
+            config_messages += messages
+
+        batch = self._mqtt.publish(config_messages)
+        if batch.wait(self._mqtt.publish_timeout):
+            _LOGGER.info(
+                "Published %d config messages (%d unchanged skipped, %d failed) in %.1f ms",
+                batch.size,
+                batch.skipped,
+                batch.failed,
+                batch.latency * 1000,
+            )
+        else:
+            _LOGGER.warning("Config messages not delivered within %d seconds", self._mqtt.publish_timeout)
@@ -1,49 +1,58 @@
+import ast
+import hashlib
 import importlib
 from pathlib import Path
-import pkg_resources
 import re
 import os
+import sys
+
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.version import InvalidVersion
 
 import logger
 
+try:
+    from importlib.metadata import version, PackageNotFoundError
+except ImportError:  # Python 3.7
+    from pkg_resources import get_distribution, DistributionNotFound as PackageNotFoundError
+
+    def version(distribution_name):
+        return get_distribution(distribution_name).version
+
 _LOGGER = logger.get(__name__)
 
+WORKERS_DIR = Path(__file__).resolve().parent / 'workers'
+# Fingerprint of the last environment whose requirements were satisfied
+VERIFIED_CACHE = Path(__file__).resolve().parent / '.requirements-verified'
+_EGG = re.compile(r'.+#egg=([^&]+)')
+_URL = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*://')
+
 
 def configured_workers():
     from config import settings
 
     workers = settings['manager']['workers']
-    return _get_requirements(workers)
+    # Named worker instances give their worker type
+    return _get_requirements({(config or {}).get('type', name) for name, config in workers.items()})
 
 
 def all_workers():
-    workers = map(lambda x: x.stem, Path('./workers').glob('*.py'))
+    workers = map(lambda x: x.stem, WORKERS_DIR.glob('*.py'))
     return _get_requirements(workers)
 
 
-def verify():
+def verify(use_cache=True):
     requirements = configured_workers()
-    egg = re.compile(r'.+#egg=(.+)$')
-
-    distributions = []
-    for req in requirements:
-        try:
-            pkg_resources.Requirement.parse(req)
-            distributions.append(req)
-        except (pkg_resources.extern.packaging.requirements.InvalidRequirement,
-                pkg_resources.RequirementParseError):
-            match = egg.match(req)
-            if match:
-                distributions.append(match.group(1))
-            else:
-                raise
+    fingerprint = _fingerprint(requirements)
+    if use_cache and _read_verified() == fingerprint:
+        _LOGGER.debug('Requirements unchanged since last verified, skipping')
+        return
 
     errors = []
-    for dist in distributions:
-        try:
-            pkg_resources.require(dist)
-        except pkg_resources.ResolutionError as e:
-            errors.append(e.report())
+    for req in requirements:
+        error = _check_requirement(req)
+        if error:
+            errors.append(error)
 
     if errors:
         _LOGGER.error('Error: unsatisfied requirements:')
@@ -59,16 +68,128 @@ def verify():
                       os.path.dirname(os.path.abspath(__file__)), prefix)
         exit(1)
 
+    _write_verified(fingerprint)
+
+
+def _fingerprint(requirements):
+    """
+    Fingerprint of the interpreter, the requirements and the import path. Installing or removing
+    a distribution changes the modification time of the directory it is installed to.
+    """
+    digest = hashlib.sha1()
+    digest.update(sys.executable.encode())
+    digest.update(sys.version.encode())
+    for req in sorted(requirements):
+        digest.update(req.encode())
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    for path in sys.path:
+        # Our own directory changes with every cache write
+        if os.path.abspath(path or '.') == app_dir:
+            continue
+        try:
+            digest.update('{}:{}'.format(path, os.stat(path or '.').st_mtime_ns).encode())
+        except OSError:
+            digest.update(path.encode())
+    return digest.hexdigest()
+
+
+def _read_verified():
+    try:
+        return VERIFIED_CACHE.read_text().strip()
+    except OSError:
+        return None
+
+
+def _write_verified(fingerprint):
+    try:
+        VERIFIED_CACHE.write_text(fingerprint)
+    except OSError as e:
+        _LOGGER.debug('Unable to cache verified requirements: %s', e)
+
+
+def _parse_requirement(req):
+    """
+    :return: distribution name and version specifier of a requirement, the name is None for URLs
+        that don't give it and the specifier None when the version can't be checked
+    """
+    match = _EGG.match(req)
+    if match:
+        return match.group(1), None
+    if _URL.match(req):
+        return None, None
+
+    try:
+        requirement = Requirement(req)
+    except InvalidRequirement as e:
+        raise ValueError('Invalid requirement: {}: {}'.format(req, e))
+    if requirement.url:
+        return requirement.name, None
+    return requirement.name, requirement.specifier
+
+
+def _check_requirement(req):
+    """
+    Check a requirement against the installed distributions
+    :return: error message, None when satisfied
+    """
+    name, specifier = _parse_requirement(req)
+    if name is None:
+        _LOGGER.info('Not checking %s, the distribution it installs is unknown', req)
+        return None
+
+    installed = _installed_version(name)
+    if installed is None:
+        return 'The \'{}\' distribution was not found and is required by the application'.format(name)
+    try:
+        satisfied = specifier is None or specifier.contains(installed, prereleases=True)
+    except InvalidVersion:
+        satisfied = False
+    if not satisfied:
+        return '{} {} is installed but {} is required'.format(name, installed, req)
+    return None
+
+
+def _installed_version(name):
+    for candidate in (name, name.replace('_', '-'), name.replace('-', '_')):
+        try:
+            return version(candidate)
+        except PackageNotFoundError:
+            continue
+    return None
+
 
 def _get_requirements(workers):
     requirements = set()
 
     for worker_name in workers:
-        module_obj = importlib.import_module("workers.%s" % worker_name)
-
-        try:
-            requirements.update(module_obj.REQUIREMENTS)
-        except AttributeError:
-            continue
+        requirements.update(_read_requirements(worker_name))
 
     return requirements
+
+
+def _read_requirements(worker_name):
+    """
+    Read the REQUIREMENTS of a worker from its source, without importing it.
+    Falls back to importing the module when they aren't declared as a literal.
+    """
+    path = WORKERS_DIR / '{}.py'.format(worker_name)
+    try:
+        tree = ast.parse(path.read_text(encoding='utf-8'), str(path))
+    except (OSError, SyntaxError):
+        tree = None
+
+    if tree is not None:
+        for node in tree.body:
+            if (
+                isinstance(node, ast.Assign)
+                and any(isinstance(target, ast.Name) and target.id == 'REQUIREMENTS' for target in node.targets)
+            ):
+                try:
+                    return ast.literal_eval(node.value)
+                except ValueError:
+                    break
+        else:
+            return []
+
+    module_obj = importlib.import_module("workers.%s" % worker_name)
+    return getattr(module_obj, 'REQUIREMENTS', [])